@@ -1,17 +1,54 @@
-import folium
 import requests
 import pandas as pd
 import json
+import hashlib
 import numpy as np
+import asyncio
+import re
+from itertools import islice
+from functools import lru_cache
+from string import Template
 from collections import Counter
 from datetime import datetime
-from ollama import chat
+from ollama import AsyncClient
+from Generators.common.merged_parquet import to_arrow_table, open_parquet_writer
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return args[0] if args and callable(args[0]) else (lambda f: f)
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pacsv = pq = None
+
 show_markers = False
 
+# Max concurrent Ollama requests per backend; match each server's OLLAMA_NUM_PARALLEL
+OLLAMA_NUM_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', 8))
+# Rows packed into a single prompt; gains flatten out beyond ~16
+OLLAMA_BATCH_SIZE = 12
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+# Comma-separated backends to spread batches over, e.g. http://h1:11434,http://h2:11434
+OLLAMA_HOSTS = [h.strip() for h in os.getenv('OLLAMA_HOSTS', OLLAMA_HOST).split(',') if h.strip()]
+# Keep the model resident for the whole run instead of reloading it after the default 5 minutes
+OLLAMA_KEEP_ALIVE = '60m'
+
 UPDATED_MERGED_PATH = r"\leakmap\Data\combined\merged_updated.csv"
 ORIGINAL_MERGED_PATH = r"\leakmap\Final\merged.csv"
+# Columnar copy of merged_updated.csv, read instead of the CSV when it is up to date
+UPDATED_MERGED_PARQUET = UPDATED_MERGED_PATH.replace('.csv', '.parquet')
+OLLAMA_CACHE_PATH = UPDATED_MERGED_PATH + '.ollama_cache.json'
 
 # --- Country name to ISO mapping ---
 COUNTRY_TO_ISO = {
@@ -24,142 +61,375 @@ COUNTRY_TO_ISO = {
     'Venezuela': 'VEN', 'Egypt': 'EGY', 'Nigeria': 'NGA', 'Kenya': 'KEN', 'Thailand': 'THA', 'Vietnam': 'VNM', 'Singapore': 'SGP',
     'South Korea': 'KOR', 'New Zealand': 'NZL', 'Saudi Arabia': 'SAU', 'UAE': 'ARE', 'USA': 'USA', 'UK': 'GBR'
 }
+# Built once so lookups are a single vectorized Series.map
+ISO_SERIES = pd.Series(COUNTRY_TO_ISO)
 
 # --- Load merged data ---
+CHUNK_SIZE = 200_000
+CSV_BLOCK_SIZE = 64 << 20  # bytes per pyarrow batch, roughly CHUNK_SIZE rows
+CATEGORY_COLUMNS = ['tld', 'final_country', 'ollama_country']
+
+def as_categories(df):
+    """Store the low-cardinality country/TLD columns as categoricals"""
+    cols = [c for c in CATEGORY_COLUMNS if c in df.columns]
+    return df.astype({c: 'category' for c in cols})
+
+def iter_chunks(path, chunksize=CHUNK_SIZE):
+    """Stream a merged CSV in chunks, using pyarrow's multi-threaded parser when installed"""
+    if pacsv is None:
+        with pd.read_csv(path, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield as_categories(chunk)
+        return
+    # Read every column as text so a late block can't contradict the types inferred from the first one
+    columns = pd.read_csv(path, nrows=0).columns
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in columns}, strings_can_be_null=True)
+    )
+    for batch in reader:
+        yield as_categories(batch.to_pandas())
+
+def iter_parquet_chunks(path, chunksize=CHUNK_SIZE):
+    """Stream a Parquet file in row batches"""
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+        yield as_categories(batch.to_pandas())
+
+def parquet_is_current():
+    """True if the Parquet sidecar exists and is not older than merged_updated.csv"""
+    if pq is None or not os.path.exists(UPDATED_MERGED_PARQUET):
+        return False
+    return not os.path.exists(UPDATED_MERGED_PATH) or os.path.getmtime(UPDATED_MERGED_PARQUET) >= os.path.getmtime(UPDATED_MERGED_PATH)
+
 def load_merged_data(prefer_updated=True):
+    """Return a chunk iterator over the best available merged data and where it came from"""
     if prefer_updated:
-        try:
-            df = pd.read_csv(UPDATED_MERGED_PATH)
-            print(f"Loaded {len(df)} rows from existing merged_updated.csv")
-            return df, 'updated'
-        except FileNotFoundError:
-            print("No existing merged_updated.csv found, will build from merged.csv.")
-    try:
-        df = pd.read_csv(ORIGINAL_MERGED_PATH)
-        print(f"Loaded {len(df)} rows from merged.csv")
-        return df, 'original'
-    except FileNotFoundError:
-        print("Error: merged.csv not found.")
-        return pd.DataFrame(), 'none'
+        if parquet_is_current():
+            print("Streaming existing merged_updated.parquet")
+            return iter_parquet_chunks(UPDATED_MERGED_PARQUET), 'parquet'
+        if os.path.exists(UPDATED_MERGED_PATH):
+            print("Streaming existing merged_updated.csv")
+            return iter_chunks(UPDATED_MERGED_PATH), 'updated'
+        print("No existing merged_updated.csv found, will build from merged.csv.")
+    if os.path.exists(ORIGINAL_MERGED_PATH):
+        print("Streaming merged.csv")
+        return iter_chunks(ORIGINAL_MERGED_PATH), 'original'
+    print("Error: merged.csv not found.")
+    return None, 'none'
 
-# --- Ollama helper ---
-def query_ollama_for_country(context_text: str):
+def country_full_incomplete(path):
+    """True if the file has no country_full column or any row is still missing it"""
+    if path.endswith('.parquet'):
+        if 'country_full' not in pq.read_schema(path).names:
+            return True
+        return pq.read_table(path, columns=['country_full']).column('country_full').null_count > 0
+    if 'country_full' not in pd.read_csv(path, nrows=0).columns:
+        return True
+    return any(chunk['country_full'].isna().any() for chunk in pd.read_csv(path, usecols=['country_full'], chunksize=CHUNK_SIZE))
+
+# --- Ollama helpers ---
+async def query_ollama_for_country(client: AsyncClient, context_text: str):
     prompt = f"""Identify the country (in English) based on this information. Return only the country name or 'unknown'.\n\n{context_text}"""
     try:
-        response = chat(messages=[{'role': 'user', 'content': prompt}], model='granite3.1-dense:2b')
+        response = await client.chat(messages=[{'role': 'user', 'content': prompt}], model='granite3.1-dense:2b', keep_alive=OLLAMA_KEEP_ALIVE)
         country = response['message']['content'].strip()
         return country if country and country.lower() != 'unknown' else None
     except Exception as e:
         print(f"  ⚠️ Ollama error: {e}")
         return None
 
+async def query_ollama_batch(client: AsyncClient, contexts: list[str]) -> list[str | None]:
+    """Ask for the countries of several records in one prompt, one numbered answer line per record"""
+    if len(contexts) == 1:
+        return [await query_ollama_for_country(client, contexts[0])]
+    items = "\n\n".join(f"{n}) {ctx}" for n, ctx in enumerate(contexts, 1))
+    prompt = f"""Identify the country (in English) for each item below. For each item output exactly one line `N: <country or unknown>`, nothing else.\n\n{items}"""
+    try:
+        response = await client.chat(messages=[{'role': 'user', 'content': prompt}], model='granite3.1-dense:2b', keep_alive=OLLAMA_KEEP_ALIVE)
+        content = response['message']['content']
+    except Exception as e:
+        print(f"  ⚠️ Ollama error: {e}")
+        return [None] * len(contexts)
+    countries = [None] * len(contexts)
+    for n, answer in re.findall(r'^\s*(\d+)\s*[:.)]\s*(.*)$', content, flags=re.MULTILINE):
+        idx = int(n) - 1
+        answer = answer.strip().strip('`*').strip()
+        if 0 <= idx < len(contexts) and answer and answer.lower() != 'unknown':
+            countries[idx] = answer
+    return countries
+
+async def infer_countries(contexts):
+    """Query Ollama batch-by-batch, round-robin over OLLAMA_HOSTS with OLLAMA_NUM_PARALLEL batches in flight per host"""
+    # One client per host and event loop, so every batch reuses its keep-alive connection pool
+    clients = [AsyncClient(host=h) for h in OLLAMA_HOSTS]
+    sems = [asyncio.Semaphore(OLLAMA_NUM_PARALLEL) for _ in clients]
+    it = iter(contexts)
+    batches = list(iter(lambda: list(islice(it, OLLAMA_BATCH_SIZE)), []))
+
+    async def infer(i, batch):
+        n = i % len(clients)
+        async with sems[n]:
+            return await query_ollama_batch(clients[n], batch)
+
+    results = await asyncio.gather(*[infer(i, b) for i, b in enumerate(batches)])
+    return [country for batch in results for country in batch]
+
+# --- Ollama result cache (sha1(context) -> country) ---
+def context_key(context_text: str):
+    return hashlib.sha1(context_text.encode('utf-8')).hexdigest()
+
+def load_ollama_cache(path=OLLAMA_CACHE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        print(f"Loaded {len(cache)} cached Ollama answers")
+        return cache
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Ollama cache load failed: {e}")
+        return {}
+
+def save_ollama_cache(cache, path=OLLAMA_CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+
 # --- Country cleaning ---
+CLEAN_MAP = {
+    'USA': 'United States', 'US': 'United States', 'UK': 'United Kingdom',
+    'Deutschland': 'Germany', 'España': 'Spain', 'Italia': 'Italy', 'Suisse': 'Switzerland', 'Schweiz': 'Switzerland'
+}
+
 def clean_country_name(country):
     if pd.isna(country) or not str(country).strip():
         return None
-    mapping = {
-        'USA': 'United States', 'US': 'United States', 'UK': 'United Kingdom',
-        'Deutschland': 'Germany', 'España': 'Spain', 'Italia': 'Italy', 'Suisse': 'Switzerland', 'Schweiz': 'Switzerland'
-    }
     c = str(country).strip()
-    return mapping.get(c, c)
+    return CLEAN_MAP.get(c, c)
+
+def clean_country_names(s):
+    """Vectorized clean_country_name for a whole column"""
+    s = s.astype('string').str.strip()
+    return s.mask(s == '').replace(CLEAN_MAP)
+
+def text_column(df, col):
+    """Return a column as stripped strings with blanks as NA (all NA if the column is absent)"""
+    if col not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype='string')
+    s = df[col].astype('string').str.strip()
+    return s.mask(s == '')
+
+def build_contexts(df):
+    """Build the Ollama prompt context for every row of df"""
+    fields = [('Domain', 'domain'), ('Description', 'description'), ('Company', 'company_name'), ('Location', 'location')]
+    parts = [f"{label}: " + text_column(df, col).fillna('') for label, col in fields]
+    contexts = parts[0]
+    for part in parts[1:]:
+        contexts = contexts + "\n" + part
+    return contexts.tolist()
+
+def identity_keys(df):
+    """domain|company|location per row; rows sharing it describe the same organisation"""
+    cols = ['domain', 'company_name', 'location']
+    parts = [text_column(df, col).str.lower().fillna('') for col in cols]
+    return parts[0] + '|' + parts[1] + '|' + parts[2]
 
 # --- Fill missing country info ---
 def fill_country_full(df):
-    df['country_full'] = None
-    for i, row in df.iterrows():
-        base = row.get('final_country') or row.get('ollama_country') or None
-        country = clean_country_name(base)
-        if not country or country.lower() in ['unknown', 'none', '']:
-            context = f"Domain: {row.get('domain', '')}\nDescription: {row.get('description', '')}\nCompany: {row.get('company_name', '')}\nLocation: {row.get('location', '')}"
-            print(f"→ Inferring country for {row.get('domain', 'unknown domain')} ...")
-            country = query_ollama_for_country(context)
-        if not country:
-            tld = str(row.get('tld', '')).lower()
-            fallback = COUNTRY_TO_ISO.get(tld.upper(), None)
-            if fallback:
-                country = fallback
-        if not country:
-            country = 'Unknown'
-        df.at[i, 'country_full'] = clean_country_name(country)
+    """Fill country_full for the rows that don't have one yet, keeping existing values"""
+    existing = text_column(df, 'country_full')
+    todo = existing.isna()
+    if not todo.any():
+        print("✓ country_full already complete")
+        return df
+    rows = df.loc[todo]
+
+    base = text_column(rows, 'final_country').combine_first(text_column(rows, 'ollama_country'))
+    cleaned = base.replace(CLEAN_MAP)
+    needs_llm = cleaned.isna() | cleaned.str.lower().isin(['unknown', 'none', ''])
+    country = cleaned.mask(needs_llm)
+
+    # Infer the remaining countries with concurrent Ollama requests
+    if needs_llm.any():
+        # Ask once per organisation; every duplicate row gets the same answer
+        ids = identity_keys(rows.loc[needs_llm])
+        uniq = ids.drop_duplicates()
+        contexts = build_contexts(rows.loc[uniq.index])
+        keys = [context_key(c) for c in contexts]
+        cache = load_ollama_cache()
+        # Only send contexts that are neither cached nor duplicates of one already queued
+        pending = {k: c for k, c in zip(keys, contexts) if k not in cache}
+        if pending:
+            print(f"→ Inferring country for {len(pending)} unique contexts (batches of {OLLAMA_BATCH_SIZE}, {OLLAMA_NUM_PARALLEL} concurrent requests x {len(OLLAMA_HOSTS)} hosts) ...")
+            results = asyncio.run(infer_countries(list(pending.values())))
+            cache.update({k: c for k, c in zip(pending, results) if c})
+            save_ollama_cache(cache)
+        print(f"✓ {len(ids)} rows needed inference, {len(uniq)} unique organisations, {len(pending)} sent to Ollama")
+        lut = dict(zip(uniq, (cache.get(k) for k in keys)))
+        country.loc[needs_llm] = ids.map(lut)
+
+    # TLD fallback, only for rows the model could not place
+    mask = country.isna()
+    if mask.any() and 'tld' in rows.columns:
+        tld_iso = rows.loc[mask, 'tld'].astype('string').str.upper().map(ISO_SERIES)
+        country.loc[mask] = tld_iso
+    existing.loc[todo] = clean_country_names(country).fillna('Unknown')
+    df['country_full'] = existing.astype('category')
     print("✓ country_full column filled")
     return df
 
 # --- Count leaks by country ---
 def count_leaks_by_country(df):
-    counts = Counter()
-    for _, row in df.iterrows():
-        c = row.get('country_full')
-        if c and c != 'Unknown':
-            counts[c] += 1
-    return counts
+    s = df['country_full']
+    counts = s[s.notna() & (s != '') & (s != 'Unknown')].value_counts()
+    # Categorical columns also report unused categories with a count of 0
+    return Counter(counts[counts > 0].to_dict())
+
+# --- Severity buckets (share of the max count) ---
+SEVERITY_LABELS = ['No Data', 'Low', 'Medium', 'High', 'Critical']
+SEVERITY_COLORS = {
+    'Critical': '#800026',
+    'High': '#BD0026',
+    'Medium': '#E31A1C',
+    'Low': '#FC4E2A',
+    'No Data': 'lightgray'
+}
 
 # --- GeoJSON Loader ---
+@lru_cache(maxsize=1)
 def download_world_geojson():
+    """Load the world GeoJSON once per process; returns (geojson, {feature id: centroid})"""
     try:
-        with open(r'\leakmap\Data\geodata\geojson.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(r'\leakmap\Data\geodata\geojson.json', 'rb') as f:
+            data = f.read()
+        geo = orjson.loads(data) if orjson else json.loads(data)
     except Exception as e:
         print(f"⚠️ GeoJSON load failed: {e}")
-        return {'type': 'FeatureCollection', 'features': []}
+        geo = {'type': 'FeatureCollection', 'features': []}
+    return geo, build_centroid_index(geo)
 
 # --- Map ---
+# YlOrRd, 6 classes; countries without data fall back to NAN_FILL_COLOR
+CHOROPLETH_COLORS = ['#ffffb2', '#fed976', '#feb24c', '#fd8d3c', '#f03b20', '#bd0026']
+NAN_FILL_COLOR = 'lightgray'
+
+MAP_TEMPLATE = Template('''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+    <title>$page_title</title>
+    <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css" />
+    <script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"></script>
+    <style>
+        html, body { width: 100%; height: 100%; margin: 0; padding: 0; }
+        #map { position: relative; width: 100%; height: 100%; }
+    </style>
+</head>
+<body>
+    <div id="map"></div>
+    $legend_html
+    $scale_html
+    $title_html
+    <script>
+    var geojson = $geojson;
+    var fills = $fills;
+    var markers = $markers;
+
+    var map = L.map('map', { center: [20, 0], zoom: 2 });
+    var tiles = L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
+        maxZoom: 19,
+        attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+    }).addTo(map);
+
+    var choropleth = L.geoJSON(geojson, {
+        style: function (feature) {
+            var fill = fills[feature.id];
+            return {
+                weight: 1, color: 'black', opacity: 0.2,
+                fillColor: fill || '$nan_fill_color', fillOpacity: fill ? 0.7 : 0.3
+            };
+        }
+    }).addTo(map);
+
+    var overlays = { '$layer_name': choropleth };
+    if (markers.length) {
+        var pins = L.layerGroup(markers.map(function (m) {
+            return L.circleMarker([m.lat, m.lng], {
+                radius: m.radius, color: 'black', weight: 2, fillColor: m.color, fillOpacity: 0.7
+            }).bindPopup(m.popup, { maxWidth: 220 }).bindTooltip(m.tooltip);
+        })).addTo(map);
+        overlays['Markers'] = pins;
+    }
+    L.control.layers({ 'OpenStreetMap': tiles }, overlays).addTo(map);
+    </script>
+</body>
+</html>
+''')
+
+def to_json(obj):
+    """Serialize for embedding in a <script> block"""
+    text = orjson.dumps(obj).decode('utf-8') if orjson else json.dumps(obj, ensure_ascii=False)
+    return text.replace('</', '<\\/')
+
+def create_color_scale(thresholds, legend_name):
+    """Small bottom-left key for the choropleth classes"""
+    swatches = ''.join(
+        f'<div><i style="background: {color}; width: 12px; height: 12px; display: inline-block; margin-right: 6px;"></i>{lo:.2f} – {hi:.2f}</div>'
+        for color, lo, hi in zip(CHOROPLETH_COLORS, thresholds[:-1], thresholds[1:])
+    )
+    return f'''
+    <div style="position: fixed; bottom: 20px; left: 10px; z-index:9999; background-color: white;
+                border:2px solid grey; border-radius: 5px; padding: 6px 8px; font-size:11px;">
+        <b>{legend_name}</b>{swatches}
+    </div>
+    '''
+
 def create_country_choropleth_map(country_counts, output_file='leak_map_countries.html'):
-    geo = download_world_geojson()
-    data = []
+    geo, centroids = download_world_geojson()
     max_count = max(country_counts.values()) if country_counts else 1
-    for c, cnt in country_counts.items():
-        iso = COUNTRY_TO_ISO.get(c, c.upper()[:3])
-        data.append({'country': c, 'iso': iso, 'count': cnt, 'log': np.log10(cnt + 1), 'severity': get_severity_level(cnt, max_count)})
-    df = pd.DataFrame(data)
-    m = folium.Map(location=[20, 0], zoom_start=2, tiles='OpenStreetMap')
-    
-    folium.Choropleth(
-        geo_data=geo,
-        name='Leaks by Country',
-        data=df,
-        columns=['iso', 'log'],
-        key_on='feature.id',
-        fill_color='YlOrRd',
-        fill_opacity=0.7,
-        line_opacity=0.2,
-        legend_name='Log Leaks per Country',
-        nan_fill_color='lightgray',
-        nan_fill_opacity=0.3
-    ).add_to(m)
-    
+    countries = pd.Series(np.fromiter(country_counts.keys(), dtype=object, count=len(country_counts)), dtype=object)
+    counts = np.fromiter(country_counts.values(), dtype=np.int64, count=len(country_counts))
+    isos = countries.map(ISO_SERIES).fillna(countries.str.upper().str[:3])
+    df = pd.DataFrame({'country': countries, 'iso': isos, 'count': counts, 'log': np.log10(counts + 1.0)})
+    bins = [-1, 0, max_count * 0.1, max_count * 0.3, max_count * 0.6, max_count]
+    df['severity'] = pd.cut(df['count'], bins=bins, labels=SEVERITY_LABELS)
+    df['color'] = df['severity'].map(SEVERITY_COLORS)
+
+    # Six equal-width classes over the log counts, like folium's default Choropleth bins
+    log_values = df['log'].to_numpy()
+    lo, hi = (float(log_values.min()), float(log_values.max())) if len(log_values) else (0.0, 1.0)
+    thresholds = np.linspace(lo, hi if hi > lo else lo + 1, len(CHOROPLETH_COLORS) + 1)
+    classes = np.clip(np.digitize(log_values, thresholds[1:-1], right=True), 0, len(CHOROPLETH_COLORS) - 1)
+    fills = dict(zip(df['iso'].tolist(), np.asarray(CHOROPLETH_COLORS)[classes].tolist()))
+
     # Add pins for countries with leaks
-    for _, row in df.iterrows():
-        coords = get_country_centroid(geo, row['iso'])
-        if coords:
-            color = get_severity_color(row['severity'])
-            if show_markers:
-                folium.CircleMarker(
-                    location=coords,
-                    radius=min(5 + (row['count'] / max_count) * 20, 25),
-                    popup=folium.Popup(
-                        f"""
+    markers = []
+    if show_markers:
+        # Plain Python values column by column; also keeps numpy scalars out of the JSON
+        rows = zip(df['country'].tolist(), df['iso'].tolist(), df['count'].tolist(), df['severity'].tolist(), df['color'].tolist())
+        for country, iso, count, severity, color in rows:
+            coords = centroids.get(iso)
+            if coords:
+                markers.append({
+                    'lat': coords[0],
+                    'lng': coords[1],
+                    'radius': min(5 + (count / max_count) * 20, 25),
+                    'color': color,
+                    'popup': f"""
                         <div style="font-family: Arial; width: 200px;">
-                            <h4 style="margin: 0; color: #333;">{row['country']}</h4>
+                            <h4 style="margin: 0; color: #333;">{country}</h4>
                             <hr style="margin: 5px 0;">
-                            <p style="margin: 5px 0;"><b>Leaked Domains:</b> {row['count']}</p>
-                            <p style="margin: 5px 0;"><b>Severity:</b> {row['severity']}</p>
-                            <p style="margin: 5px 0;"><b>ISO Code:</b> {row['iso']}</p>
+                            <p style="margin: 5px 0;"><b>Leaked Domains:</b> {count}</p>
+                            <p style="margin: 5px 0;"><b>Severity:</b> {severity}</p>
+                            <p style="margin: 5px 0;"><b>ISO Code:</b> {iso}</p>
                         </div>
                         """,
-                        max_width=220
-                    ),
-                    color='black',
-                    fillColor=color,
-                    fillOpacity=0.7,
-                    weight=2,
-                    tooltip=f"{row['country']}: {row['count']} leaks"
-                ).add_to(m)
-    
-    # Add custom legend
-    legend_html = create_custom_legend(country_counts, max_count)
-    m.get_root().html.add_child(folium.Element(legend_html))
-    
+                    'tooltip': f"{country}: {count} leaks"
+                })
+
     # Add title
     title_html = '''
     <h2 align="center" style="font-size:24px; margin-top:10px; color:#333;">
@@ -169,63 +439,64 @@ def create_country_choropleth_map(country_counts, output_file='leak_map_countrie
         Countries colored by number of leaked domains
     </p>
     '''
-    m.get_root().html.add_child(folium.Element(title_html))
-    
-    # Add layer control
-    folium.LayerControl().add_to(m)
-    
-    m.save(output_file)
+
+    html = MAP_TEMPLATE.substitute(
+        page_title='Global Data Leaks by Country',
+        layer_name='Leaks by Country',
+        nan_fill_color=NAN_FILL_COLOR,
+        geojson=to_json(geo),
+        fills=to_json(fills),
+        markers=to_json(markers),
+        legend_html=create_custom_legend(country_counts, max_count),
+        scale_html=create_color_scale(thresholds, 'Log Leaks per Country'),
+        title_html=title_html
+    )
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(html)
     print(f"✓ Choropleth map saved as {output_file}")
-    
+
     # Print statistics
     print_map_statistics(country_counts, len(df))
 
-def get_country_centroid(geojson, iso_code):
-    """Get approximate centroid of a country feature for marker placement"""
-    try:
-        for feature in geojson.get('features', []):
-            if feature.get('id') == iso_code:
-                geometry = feature.get('geometry', {})
-                if geometry.get('type') == 'Polygon':
-                    coords = geometry['coordinates'][0]
-                    if coords:
-                        lats = [coord[1] for coord in coords]
-                        lngs = [coord[0] for coord in coords]
-                        return [sum(lats)/len(lats), sum(lngs)/len(lngs)]
-                elif geometry.get('type') == 'MultiPolygon':
-                    coords = geometry['coordinates'][0][0]
-                    if coords:
-                        lats = [coord[1] for coord in coords]
-                        lngs = [coord[0] for coord in coords]
-                        return [sum(lats)/len(lats), sum(lngs)/len(lngs)]
-                break
-    except Exception:
-        pass
-    return None
-
-def get_severity_level(count, max_count):
-    """Determine severity level based on count"""
-    if count == 0:
-        return 'No Data'
-    elif count <= max_count * 0.1:
-        return 'Low'
-    elif count <= max_count * 0.3:
-        return 'Medium'
-    elif count <= max_count * 0.6:
-        return 'High'
-    else:
-        return 'Critical'
-
-def get_severity_color(severity):
-    """Get color for severity level"""
-    colors = {
-        'Critical': '#800026',
-        'High': '#BD0026',
-        'Medium': '#E31A1C',
-        'Low': '#FC4E2A',
-        'No Data': 'lightgray'
-    }
-    return colors.get(severity, 'blue')
+def ring_area(ring):
+    """Absolute shoelace area of a coordinate ring (in squared degrees)"""
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+@njit(cache=True)
+def _centroid(coords):
+    """Mean (lat, lng) of an (N, 2) float64 array of [lng, lat] vertices"""
+    s0 = 0.0
+    s1 = 0.0
+    n = coords.shape[0]
+    for i in range(n):
+        s0 += coords[i, 1]
+        s1 += coords[i, 0]
+    return s0 / n, s1 / n
+
+def build_centroid_index(geojson):
+    """Map each feature id to an approximate [lat, lng] centroid for marker placement.
+
+    Polygons use their outer ring; MultiPolygons use the outer ring of their largest polygon.
+    """
+    centroids = {}
+    for feature in geojson.get('features', []):
+        try:
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                rings = [geometry['coordinates'][0]]
+            elif geometry.get('type') == 'MultiPolygon':
+                rings = [polygon[0] for polygon in geometry['coordinates']]
+            else:
+                continue
+            rings = [np.ascontiguousarray(np.asarray(r, dtype=np.float64)[:, :2]) for r in rings if r]
+            if not rings:
+                continue
+            lat, lng = _centroid(max(rings, key=ring_area))
+            centroids[feature.get('id')] = [float(lat), float(lng)]
+        except Exception:
+            continue
+    return centroids
 
 def create_custom_legend(country_counts, max_count):
     """Create a toggleable custom HTML legend"""
@@ -290,22 +561,47 @@ def print_map_statistics(country_counts, mapped_countries):
 
 # --- Main ---
 def main():
-    df, src = load_merged_data(prefer_updated=True)
-    if df.empty:
+    chunks, src = load_merged_data(prefer_updated=True)
+    if chunks is None:
         return
 
-    # If using pre-generated file but it's missing country_full, rebuild it
-    needs_inference = (src != 'updated') or ('country_full' not in df.columns or df['country_full'].isna().all())
-
+    # If using a pre-generated file whose country_full is missing or has gaps, fill them in
+    if src == 'parquet':
+        needs_inference = country_full_incomplete(UPDATED_MERGED_PARQUET)
+    else:
+        needs_inference = (src != 'updated') or country_full_incomplete(UPDATED_MERGED_PATH)
+    # Write to side files so merged_updated.csv/.parquet can be rebuilt while they are being read
+    tmp_path = UPDATED_MERGED_PATH + '.tmp'
+    tmp_parquet = UPDATED_MERGED_PARQUET + '.tmp'
     if needs_inference:
-        df = fill_country_full(df)
         os.makedirs(os.path.dirname(UPDATED_MERGED_PATH), exist_ok=True)
-        df.to_csv(UPDATED_MERGED_PATH, index=False)
+
+    country_counts = Counter()
+    rows = 0
+    writer = None
+    for i, chunk in enumerate(chunks):
+        rows += len(chunk)
+        if needs_inference:
+            chunk = fill_country_full(chunk)
+            chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            if pq is not None:
+                table = to_arrow_table(chunk)
+                if writer is None:
+                    writer = open_parquet_writer(tmp_parquet, table)
+                writer.write_table(table)
+        country_counts += count_leaks_by_country(chunk)
+    print(f"Processed {rows} rows")
+
+    if needs_inference:
+        os.replace(tmp_path, UPDATED_MERGED_PATH)
         print(f"✓ Saved updated CSV as {UPDATED_MERGED_PATH}")
+        if writer is not None:
+            writer.close()
+            os.replace(tmp_parquet, UPDATED_MERGED_PARQUET)
+            print(f"✓ Saved Parquet copy as {UPDATED_MERGED_PARQUET}")
     else:
-        print("✓ Using pre-generated merged_updated.csv; skipping country inference.")
+        print(f"✓ Using pre-generated merged_updated.{'parquet' if src == 'parquet' else 'csv'}; skipping country inference.")
 
-    country_counts = count_leaks_by_country(df)
     print(f"Found {len(country_counts)} countries with leaks.")
 
     # Load population and render per-capita map
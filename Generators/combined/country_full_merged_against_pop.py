@@ -2,18 +2,42 @@ import folium
 import requests
 import pandas as pd
 import json
+import pickle
+import hashlib
 import numpy as np
+import asyncio
+from functools import lru_cache
 from collections import Counter
 from datetime import datetime
-from ollama import chat
+from ollama import AsyncClient
+from Generators.common.merged_parquet import write_parquet
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pacsv = pq = None
+
 add_markers = False
 
+# Max concurrent Ollama requests; match the server's OLLAMA_NUM_PARALLEL
+OLLAMA_NUM_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', 8))
+
 country_stats = r"\leakmap\Data\geodata\worldpopulation.csv"
 # Prefer using this updated file if it already exists
 UPDATED_MERGED_PATH = r"\leakmap\Data\combined\merged_updated.csv"
 ORIGINAL_MERGED_PATH = r"\leakmap\Final\merged.csv"
+# Columnar copy of merged_updated.csv (shared with country_full_merged.py), read instead of the CSV when up to date
+UPDATED_MERGED_PARQUET = UPDATED_MERGED_PATH.replace('.csv', '.parquet')
+# Same cache file and keys as country_full_merged.py, so both generators reuse each other's answers
+OLLAMA_CACHE_PATH = UPDATED_MERGED_PATH + '.ollama_cache.json'
 
 # --- Country name to ISO mapping ---
 COUNTRY_TO_ISO = {
@@ -27,23 +51,61 @@ COUNTRY_TO_ISO = {
     'South Korea': 'KOR', 'New Zealand': 'NZL', 'Saudi Arabia': 'SAU', 'UAE': 'ARE', 'USA': 'USA', 'UK': 'GBR'
 }
 
-# Helper: map a country_full to ISO3
-def get_iso_for_country_name(country_name: str):
-    if not country_name or str(country_name).strip().lower() == 'unknown':
-        return None
-    return COUNTRY_TO_ISO.get(str(country_name).strip())
+# Case-insensitive view of COUNTRY_TO_ISO, built once
+_ISO_LOOKUP = {k.strip().casefold(): v for k, v in COUNTRY_TO_ISO.items()}
 
 # --- Load merged data ---
+# Text stays text (no float/date inference); repetitive country/TLD columns become categoricals.
+# Columns missing from a file are ignored.
+MERGED_DTYPES = {
+    'domain': 'string', 'tld': 'category', 'final_country': 'category', 'ollama_country': 'category',
+    'description': 'string', 'company_name': 'string', 'location': 'string', 'processed_at': 'string'
+}
+
+CSV_BLOCK_SIZE = 256 << 20  # bytes per pyarrow parse block
+CHUNK_SIZE = 500_000  # rows per chunk for the plain pandas reader
+
+def read_merged_csv(path):
+    """Read a merged CSV with fixed dtypes.
+
+    pyarrow parses large blocks on its thread pool; without it the file is read in chunks and concatenated.
+    """
+    if pacsv is not None:
+        column_types = {c: pa.dictionary(pa.int32(), pa.string()) if t == 'category' else pa.string() for c, t in MERGED_DTYPES.items()}
+        table = pacsv.read_csv(
+            path,
+            read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE, use_threads=True),
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+        )
+        df = table.to_pandas()
+    else:
+        with pd.read_csv(path, dtype=MERGED_DTYPES, chunksize=CHUNK_SIZE) as reader:
+            df = pd.concat(reader, ignore_index=True)
+    # Chunks with different categories concatenate to plain objects, so cast once more
+    return df.astype({c: t for c, t in MERGED_DTYPES.items() if c in df.columns})
+
+def parquet_is_current():
+    """True if the Parquet copy exists and is not older than merged_updated.csv"""
+    if pq is None or not os.path.exists(UPDATED_MERGED_PARQUET):
+        return False
+    return not os.path.exists(UPDATED_MERGED_PATH) or os.path.getmtime(UPDATED_MERGED_PARQUET) >= os.path.getmtime(UPDATED_MERGED_PATH)
+
 def load_merged_data(prefer_updated=True):
     if prefer_updated:
+        if parquet_is_current():
+            df = pd.read_parquet(UPDATED_MERGED_PARQUET, engine='pyarrow')
+            df = df.astype({c: t for c, t in MERGED_DTYPES.items() if c in df.columns})
+            print(f"Loaded {len(df)} rows from existing merged_updated.parquet")
+            return df, 'updated'
         try:
-            df = pd.read_csv(UPDATED_MERGED_PATH)
+            df = read_merged_csv(UPDATED_MERGED_PATH)
             print(f"Loaded {len(df)} rows from existing merged_updated.csv")
             return df, 'updated'
         except FileNotFoundError:
             print("No existing merged_updated.csv found, will build from merged.csv.")
     try:
-        df = pd.read_csv(ORIGINAL_MERGED_PATH)
+        df = read_merged_csv(ORIGINAL_MERGED_PATH)
         print(f"Loaded {len(df)} rows from merged.csv")
         return df, 'original'
     except FileNotFoundError:
@@ -53,113 +115,211 @@ def load_merged_data(prefer_updated=True):
 # --- Load population data (ISO3 -> population) ---
 def load_population_data(path=country_stats):
     try:
-        pop_df = pd.read_csv(path)
-        # Normalize column names
-        pop_df.columns = [c.strip() for c in pop_df.columns]
+        # Read the header first so only the code, indicator and year columns get parsed
+        raw_columns = {c.strip(): c for c in pd.read_csv(path, nrows=0).columns}
         # Prefer 2024; else use latest numeric year present
-        year_col = '2024' if '2024' in pop_df.columns else None
+        year_col = '2024' if '2024' in raw_columns else None
         if not year_col:
-            numeric_years = sorted([int(c) for c in pop_df.columns if c.isdigit()])
+            numeric_years = sorted([int(c) for c in raw_columns if c.isdigit()])
             year_col = str(numeric_years[-1]) if numeric_years else None
         if not year_col:
             print("⚠️ Population CSV missing a usable year column.")
             return {}, 'N/A'
-        # Keep rows for population indicator if present
+        wanted = [raw_columns[c] for c in ('Country Code', 'Indicator Name', year_col) if c in raw_columns]
+        if pacsv is not None:
+            pop_df = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(include_columns=wanted)).to_pandas()
+        else:
+            pop_df = pd.read_csv(path, usecols=wanted, dtype={raw_columns['Country Code']: 'string'})
+        # Normalize column names
+        pop_df.columns = [c.strip() for c in pop_df.columns]
+        # Keep rows for population indicator if present, with a numeric value and a code
+        keep = pd.Series(True, index=pop_df.index)
         if 'Indicator Name' in pop_df.columns:
-            pop_df = pop_df[pop_df['Indicator Name'].astype(str).str.contains('Population', na=False)]
-        pop_df = pop_df[['Country Code', year_col]].dropna()
-        pop_df[year_col] = pd.to_numeric(pop_df[year_col], errors='coerce')
-        pop_df = pop_df.dropna(subset=[year_col])
+            keep = pop_df['Indicator Name'].astype(str).str.contains('Population', na=False)
+        pop = pd.to_numeric(pop_df[year_col], errors='coerce')
+        codes = pop_df['Country Code'].astype('string').str.upper()
+        keep &= pop.notna() & codes.notna()
         # Build ISO3 -> population mapping
-        pop_map = dict(zip(pop_df['Country Code'].str.upper(), pop_df[year_col].astype(float)))
+        pop_map = dict(zip(codes[keep].to_numpy(), pop[keep].to_numpy(dtype=np.float64)))
         print(f"Loaded population for {len(pop_map)} countries (year {year_col}).")
         return pop_map, year_col
     except Exception as e:
         print(f"⚠️ Error loading population data: {e}")
         return {}, 'N/A'
 
-# --- Ollama helper ---
-def query_ollama_for_country(context_text: str):
+# --- Ollama helpers ---
+async def query_ollama_for_country(client: AsyncClient, context_text: str):
     prompt = f"""Identify the country (in English) based on this information. Return only the country name or 'unknown'.\n\n{context_text}"""
     try:
-        response = chat(messages=[{'role': 'user', 'content': prompt}], model='granite3.1-dense:2b')
+        response = await client.chat(messages=[{'role': 'user', 'content': prompt}], model='granite3.1-dense:2b')
         country = response['message']['content'].strip()
         return country if country and country.lower() != 'unknown' else None
     except Exception as e:
         print(f"  ⚠️ Ollama error: {e}")
         return None
 
+async def infer_countries(contexts):
+    """Query Ollama for all contexts concurrently, keeping at most OLLAMA_NUM_PARALLEL in flight"""
+    sem = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+    client = AsyncClient()
+
+    async def infer(ctx):
+        async with sem:
+            return await query_ollama_for_country(client, ctx)
+
+    return await asyncio.gather(*[infer(c) for c in contexts])
+
+# --- Ollama result cache (sha1(context) -> country) ---
+def context_key(context_text: str):
+    return hashlib.sha1(context_text.encode('utf-8')).hexdigest()
+
+def load_ollama_cache(path=OLLAMA_CACHE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        print(f"Loaded {len(cache)} cached Ollama answers")
+        return cache
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Ollama cache load failed: {e}")
+        return {}
+
+def save_ollama_cache(cache, path=OLLAMA_CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+
 # --- Country cleaning ---
+COUNTRY_NAME_MAP = {
+    'USA': 'United States', 'US': 'United States', 'UK': 'United Kingdom',
+    'Deutschland': 'Germany', 'España': 'Spain', 'Italia': 'Italy', 'Suisse': 'Switzerland', 'Schweiz': 'Switzerland'
+}
+
 def clean_country_name(country):
     if pd.isna(country) or not str(country).strip():
         return None
-    mapping = {
-        'USA': 'United States', 'US': 'United States', 'UK': 'United Kingdom',
-        'Deutschland': 'Germany', 'España': 'Spain', 'Italia': 'Italy', 'Suisse': 'Switzerland', 'Schweiz': 'Switzerland'
-    }
     c = str(country).strip()
-    return mapping.get(c, c)
+    return COUNTRY_NAME_MAP.get(c, c)
+
+def clean_country_series(s: pd.Series) -> pd.Series:
+    """Vectorized clean_country_name: strip, apply COUNTRY_NAME_MAP, blanks become NA"""
+    s = s.astype('string').str.strip().replace(COUNTRY_NAME_MAP)
+    return s.where(s.str.len().gt(0))
+
+def text_column(df, col):
+    """Return a column as stripped strings with blanks as NA (all NA if the column is absent)"""
+    if col not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype='string')
+    s = df[col].astype('string').str.strip()
+    return s.mask(s == '')
+
+def build_contexts(df):
+    """Build the Ollama prompt context for every row of df"""
+    fields = [('Domain', 'domain'), ('Description', 'description'), ('Company', 'company_name'), ('Location', 'location')]
+    parts = [f"{label}: " + text_column(df, col).fillna('') for label, col in fields]
+    contexts = parts[0]
+    for part in parts[1:]:
+        contexts = contexts + "\n" + part
+    return contexts.tolist()
 
 # --- Fill missing country info ---
 def fill_country_full(df):
-    df['country_full'] = None
-    for i, row in df.iterrows():
-        base = row.get('final_country') or row.get('ollama_country') or None
-        country = clean_country_name(base)
-        if not country or country.lower() in ['unknown', 'none', '']:
-            context = f"Domain: {row.get('domain', '')}\nDescription: {row.get('description', '')}\nCompany: {row.get('company_name', '')}\nLocation: {row.get('location', '')}"
-            print(f"→ Inferring country for {row.get('domain', 'unknown domain')} ...")
-            country = query_ollama_for_country(context)
-        if not country:
-            tld = str(row.get('tld', '')).lower()
-            fallback = COUNTRY_TO_ISO.get(tld.upper(), None)
-            if fallback:
-                country = fallback
-        if not country:
-            country = 'Unknown'
-        df.at[i, 'country_full'] = clean_country_name(country)
+    base = text_column(df, 'final_country').combine_first(text_column(df, 'ollama_country'))
+    cleaned = clean_country_series(base)
+    needs_llm = cleaned.isna() | cleaned.str.lower().isin(['unknown', 'none', ''])
+    country = cleaned.mask(needs_llm)
+
+    # Only rows without a usable country go to Ollama, all in one concurrent batch
+    if needs_llm.any():
+        contexts = build_contexts(df.loc[needs_llm])
+        keys = [context_key(c) for c in contexts]
+        cache = load_ollama_cache()
+        # Only send contexts that are neither cached nor duplicates of one already queued
+        pending = {k: c for k, c in zip(keys, contexts) if k not in cache}
+        if pending:
+            print(f"→ Inferring country for {len(pending)} unique contexts ({OLLAMA_NUM_PARALLEL} concurrent requests) ...")
+            results = asyncio.run(infer_countries(list(pending.values())))
+            cache.update({k: c for k, c in zip(pending, results) if c})
+            save_ollama_cache(cache)
+        print(f"✓ {len(contexts)} rows needed inference, {len(pending)} sent to Ollama")
+        country.loc[needs_llm] = [cache.get(k) for k in keys]
+
+    # TLD fallback for whatever is still empty
+    mask = country.isna()
+    if mask.any() and 'tld' in df.columns:
+        country.loc[mask] = df.loc[mask, 'tld'].astype('string').str.strip().str.casefold().map(_ISO_LOOKUP)
+    df['country_full'] = clean_country_series(country).fillna('Unknown')
     print("✓ country_full column filled")
     return df
 
 # --- Count leaks by country ---
 def count_leaks_by_country(df):
-    counts = Counter()
-    for _, row in df.iterrows():
-        c = row.get('country_full')
-        if c and c != 'Unknown':
-            counts[c] += 1
-    return counts
+    s = df['country_full']
+    return Counter(s[s.notna() & (s != '') & (s != 'Unknown')].value_counts().to_dict())
 
 # --- GeoJSON Loader ---
+GEOJSON_PATH = r'\leakmap\Data\geodata\geojson.json'
+# Pickled copy of the GeoJSON without feature properties, rebuilt whenever the source is newer
+GEOJSON_SLIM_PATH = GEOJSON_PATH.replace('.json', '_slim.pkl')
+
+def slim_geojson(geojson):
+    """Keep only what the choropleth and centroids use: feature id and geometry"""
+    features = []
+    for feature in geojson.get('features', []):
+        geometry = feature.get('geometry') or {}
+        features.append({
+            'type': 'Feature',
+            'id': feature.get('id'),
+            'geometry': {'type': geometry.get('type'), 'coordinates': geometry.get('coordinates')}
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+@lru_cache(maxsize=1)
 def download_world_geojson():
     try:
-        with open(r'\leakmap\Data\geodata\geojson.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        if os.path.exists(GEOJSON_SLIM_PATH) and os.path.getmtime(GEOJSON_SLIM_PATH) >= os.path.getmtime(GEOJSON_PATH):
+            with open(GEOJSON_SLIM_PATH, 'rb') as f:
+                return pickle.load(f)
+        with open(GEOJSON_PATH, 'rb') as f:
+            raw = f.read()
+        geo = slim_geojson(orjson.loads(raw) if orjson else json.loads(raw))
     except Exception as e:
         print(f"⚠️ GeoJSON load failed: {e}")
         return {'type': 'FeatureCollection', 'features': []}
+    try:
+        with open(GEOJSON_SLIM_PATH, 'wb') as f:
+            pickle.dump(geo, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"⚠️ Could not write slim GeoJSON cache: {e}")
+    return geo
 
 # --- Map (per capita) ---
+# Marker popups share one stylesheet instead of repeating inline styles in every popup
+POPUP_CSS = '<style>.leak-popup{font-family:Arial;width:220px}.leak-popup h4{margin:0;color:#333}.leak-popup hr{margin:5px 0}.leak-popup p{margin:5px 0}</style>'
+POPUP_TEMPLATE = (
+    '<div class="leak-popup"><h4>{country}</h4><hr>'
+    '<p><b>Leaked Domains:</b> {count}</p><p><b>Population ({pop_year}):</b> {pop}</p>'
+    '<p><b>Leaks per million:</b> {rate}</p><p><b>Severity:</b> {severity}</p><p><b>ISO Code:</b> {iso}</p></div>'
+)
+
 def create_country_choropleth_map(country_counts, population_by_iso, pop_year, output_file='leak_map_countries.html'):
     geo = download_world_geojson()
-    rows = []
-    # Build rows with per-capita metric
-    for country_name, cnt in country_counts.items():
-        iso = get_iso_for_country_name(country_name) or country_name.upper()[:3]
-        pop = population_by_iso.get(iso)
-        per_million = (cnt / pop * 1_000_000.0) if pop and pop > 0 else None
-        rows.append({
-            'country': country_name,
-            'iso': iso,
-            'count': cnt,
-            'population': pop,
-            'per_million': per_million
-        })
-    df = pd.DataFrame(rows)
+    # Per-capita metric, one column at a time
+    n = len(country_counts)
+    df = pd.DataFrame({
+        'country': np.fromiter(country_counts.keys(), dtype=object, count=n),
+        'count': np.fromiter(country_counts.values(), dtype=np.int64, count=n)
+    })
+    df['iso'] = df['country'].str.strip().str.casefold().map(_ISO_LOOKUP).fillna(df['country'].str.upper().str[:3])
+    df['population'] = df['iso'].map(population_by_iso)
+    df['per_million'] = (df['count'] / df['population'].where(df['population'] > 0)) * 1_000_000.0
     # Determine max rate for severity scaling
     valid_rates = df['per_million'].dropna()
     max_rate = float(valid_rates.max()) if not valid_rates.empty else 1.0
-    df['severity'] = df['per_million'].apply(lambda v: get_severity_level(v if pd.notna(v) else 0, max_rate))
+    levels = np.digitize((df['per_million'] / max_rate).fillna(0).to_numpy(), SEVERITY_BINS, right=True)
+    df['severity'] = SEVERITY_LABELS[levels]
+    df['color'] = SEVERITY_COLORS[levels]
     # Base map
     m = folium.Map(location=[20, 0], zoom_start=2, tiles='OpenStreetMap')
     # Choropleth by leaks per million
@@ -177,38 +337,43 @@ def create_country_choropleth_map(country_counts, population_by_iso, pop_year, o
         nan_fill_opacity=0.3
     ).add_to(m)
     # Pins
-    for _, row in df.iterrows():
-        coords = get_country_centroid(geo, row['iso'])
-        if not coords:
-            continue
-        color = get_severity_color(row['severity'])
-        rate = row['per_million']
-        pop_txt = f"{int(row['population']):,}" if pd.notna(row['population']) else "n/a"
-        rate_txt = f"{rate:,.2f}" if pd.notna(rate) else "n/a"
-        radius = 7 if not pd.notna(rate) else min(5 + (rate / max_rate) * 20, 25)
-        if add_markers:
-            folium.CircleMarker(
-                location=coords,
-                radius=radius,
-                popup=folium.Popup(
-                    f"""
-                    <div style="font-family: Arial; width: 220px;">
-                        <h4 style="margin: 0; color: #333;">{row['country']}</h4>
-                        <hr style="margin: 5px 0;">
-                        <p style="margin: 5px 0;"><b>Leaked Domains:</b> {row['count']}</p>
-                        <p style="margin: 5px 0;"><b>Population ({pop_year}):</b> {pop_txt}</p>
-                        <p style="margin: 5px 0;"><b>Leaks per million:</b> {rate_txt}</p>
-                        <p style="margin: 5px 0;"><b>Severity:</b> {row['severity']}</p>
-                        <p style="margin: 5px 0;"><b>ISO Code:</b> {row['iso']}</p>
-                    </div>
-                    """,
-                    max_width=260
-                ),
-                color='black',
-                fillColor=color,
-                fillOpacity=0.7,
-                weight=2,
-                tooltip=f"{row['country']}: {rate_txt} per million"
+    if add_markers:
+        m.get_root().header.add_child(folium.Element(POPUP_CSS))
+        # Index features once; centroids are then computed only for countries that get a pin
+        feature_by_id = {f.get('id'): f for f in geo.get('features', [])}
+        rates = df['per_million']
+        markers = df.assign(
+            radius=np.where(rates.isna(), 7, np.minimum(5 + (rates / max_rate) * 20, 25)),
+            pop_txt=df['population'].map('{:,.0f}'.format, na_action='ignore').fillna('n/a'),
+            rate_txt=rates.map('{:,.2f}'.format, na_action='ignore').fillna('n/a')
+        )
+        # All pins go into one GeoJSON layer instead of one Leaflet object per marker
+        features = []
+        for row in markers.itertuples(index=False):
+            coords = get_country_centroid(feature_by_id, row.iso)
+            if not coords:
+                continue
+            features.append({
+                'type': 'Feature',
+                'id': row.country,
+                'geometry': {'type': 'Point', 'coordinates': [coords[1], coords[0]]},
+                'properties': {
+                    'radius': float(row.radius),
+                    'fillColor': row.color,
+                    'popup': POPUP_TEMPLATE.format(country=row.country, count=row.count, pop_year=pop_year, pop=row.pop_txt,
+                                                   rate=row.rate_txt, severity=row.severity, iso=row.iso),
+                    'tooltip': f"{row.country}: {row.rate_txt} per million"
+                }
+            })
+        if features:
+            folium.GeoJson(
+                {'type': 'FeatureCollection', 'features': features},
+                name='Leak markers',
+                marker=folium.CircleMarker(color='black', fill=True, fill_opacity=0.7, weight=2),
+                # Only the per-country parts; folium keys these by feature id
+                style_function=lambda f: {'radius': f['properties']['radius'], 'fillColor': f['properties']['fillColor']},
+                popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=260),
+                tooltip=folium.GeoJsonTooltip(fields=['tooltip'], labels=False)
             ).add_to(m)
     # Legend (relative to max rate)
     legend_html = create_custom_legend(max_rate=max_rate,
@@ -237,53 +402,36 @@ def create_country_choropleth_map(country_counts, population_by_iso, pop_year, o
     # Stats
     print_map_statistics(country_counts, len(df), per_million_series=df.set_index('country')['per_million'])
 
-def get_country_centroid(geojson, iso_code):
-    """Get approximate centroid of a country feature for marker placement"""
+def ring_area(ring):
+    """Absolute shoelace area of a coordinate ring (in squared degrees)"""
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+def get_country_centroid(feature_by_id, iso_code):
+    """Get approximate [lat, lng] centroid of a country feature for marker placement.
+
+    Polygons use their outer ring; MultiPolygons use the outer ring of their largest polygon.
+    """
     try:
-        for feature in geojson.get('features', []):
-            if feature.get('id') == iso_code:
-                geometry = feature.get('geometry', {})
-                if geometry.get('type') == 'Polygon':
-                    coords = geometry['coordinates'][0]
-                    if coords:
-                        lats = [coord[1] for coord in coords]
-                        lngs = [coord[0] for coord in coords]
-                        return [sum(lats)/len(lats), sum(lngs)/len(lngs)]
-                elif geometry.get('type') == 'MultiPolygon':
-                    coords = geometry['coordinates'][0][0]
-                    if coords:
-                        lats = [coord[1] for coord in coords]
-                        lngs = [coord[0] for coord in coords]
-                        return [sum(lats)/len(lats), sum(lngs)/len(lngs)]
-                break
+        geometry = (feature_by_id.get(iso_code) or {}).get('geometry') or {}
+        if geometry.get('type') == 'Polygon':
+            rings = [geometry['coordinates'][0]]
+        elif geometry.get('type') == 'MultiPolygon':
+            rings = [polygon[0] for polygon in geometry['coordinates']]
+        else:
+            return None
+        rings = [np.asarray(r, dtype=np.float64)[:, :2] for r in rings if r]
+        if not rings:
+            return None
+        lng, lat = max(rings, key=ring_area).mean(axis=0)
+        return [float(lat), float(lng)]
     except Exception:
-        pass
-    return None
-
-def get_severity_level(value, max_value):
-    """Determine severity level based on relative value vs. max"""
-    if not value or max_value <= 0:
-        return 'No Data'
-    ratio = value / max_value
-    if ratio <= 0.10:
-        return 'Low'
-    elif ratio <= 0.30:
-        return 'Medium'
-    elif ratio <= 0.60:
-        return 'High'
-    else:
-        return 'Critical'
-
-def get_severity_color(severity):
-    """Get color for severity level"""
-    colors = {
-        'Critical': '#800026',
-        'High': '#BD0026',
-        'Medium': '#E31A1C',
-        'Low': '#FC4E2A',
-        'No Data': 'lightgray'
-    }
-    return colors.get(severity, 'blue')
+        return None
+
+# Severity by ratio of the max rate: 0 -> No Data, <=10% Low, <=30% Medium, <=60% High, above that Critical
+SEVERITY_BINS = [0.0, 0.10, 0.30, 0.60]
+SEVERITY_LABELS = np.array(['No Data', 'Low', 'Medium', 'High', 'Critical'])
+SEVERITY_COLORS = np.array(['lightgray', '#FC4E2A', '#E31A1C', '#BD0026', '#800026'])
 
 def create_custom_legend(max_rate, total_leaks, countries_count, metric_label):
     """Create a toggleable custom HTML legend for per-capita metric"""
@@ -353,14 +501,20 @@ def main():
     if df.empty:
         return
 
-    # If using pre-generated file but it's missing country_full, rebuild it
-    needs_inference = (src != 'updated') or ('country_full' not in df.columns or df['country_full'].isna().all())
+    # If using a pre-generated file whose country_full is missing or has gaps, fill them in
+    needs_inference = (src != 'updated') or ('country_full' not in df.columns or df['country_full'].isna().any())
 
     if needs_inference:
         df = fill_country_full(df)
         os.makedirs(os.path.dirname(UPDATED_MERGED_PATH), exist_ok=True)
         df.to_csv(UPDATED_MERGED_PATH, index=False)
         print(f"✓ Saved updated CSV as {UPDATED_MERGED_PATH}")
+        if pq is not None:
+            try:
+                write_parquet(df, UPDATED_MERGED_PARQUET)
+                print(f"✓ Saved Parquet copy as {UPDATED_MERGED_PARQUET}")
+            except Exception as e:
+                print(f"⚠️ Parquet write failed: {e}")
     else:
         print("✓ Using pre-generated merged_updated.csv; skipping country inference.")
 
@@ -0,0 +1,637 @@
+import re
+import os
+import csv
+import json
+import shutil
+import heapq
+import hashlib
+import asyncio
+import httpx
+import folium
+import requests
+import pandas as pd
+import numpy as np
+from collections import Counter
+from operator import itemgetter
+from dataclasses import dataclass
+from typing import Callable
+from Utils.country_mapping import TLD_TO_COUNTRY, COUNTRY_COORDINATES
+from ollama import AsyncClient
+from pydantic import BaseModel
+from datetime import datetime
+from types import SimpleNamespace
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pacsv = None
+
+# Max concurrent Ollama requests; match the server's OLLAMA_NUM_PARALLEL
+OLLAMA_NUM_PARALLEL = int(os.getenv('OLLAMA_NUM_PARALLEL', 8))
+
+# LLM_BACKEND=vllm sends the same requests to an OpenAI-compatible server instead
+# (vLLM, or llama.cpp's server with continuous batching)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'ollama')
+VLLM_URL = os.getenv('VLLM_URL', 'http://localhost:8000/v1')
+if LLM_BACKEND == 'vllm':
+    OLLAMA_MODEL = os.getenv('VLLM_MODEL', 'ibm-granite/granite-3.1-2b-instruct')
+else:
+    # Library tags are already 4-bit (Q4_K_M); point this at another quantization if needed
+    OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'granite3.1-dense:2b')
+# Leaks packed into one prompt; 1 sends one request per leak. Packing amortizes the system prompt
+# and round trip over the rows, but gains flatten out beyond ~10-20 rows as per-request latency grows
+OLLAMA_ROWS_PER_PROMPT = int(os.getenv('OLLAMA_ROWS_PER_PROMPT', 1))
+# Prompts stay under ~450 tokens per leak, so a small context leaves KV cache room for more parallel
+# slots. It is the same for every request, also a short last pack, so the model is never reloaded
+OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', 512 * OLLAMA_ROWS_PER_PROMPT))
+
+@dataclass(frozen=True)
+class LeakSource:
+    """Everything that differs between the per-source leak map generators"""
+    # Raw input and the generator that turns it into leak dicts
+    data_file: str
+    parser: Callable
+    # Leak keys written to the results CSV, in column order
+    fields: tuple
+    # Static instructions sent as the system message. Keeping them byte-identical across
+    # requests lets the server reuse the cached prompt prefix instead of re-reading it
+    system_prompt: str
+    # str.format template filled from the leak dict for the user message
+    prompt_template: str
+    # Leaks with the same values in these fields are treated as one entity and identified once
+    dedupe_fields: tuple
+    # Map an 'unknown' answer to the country of the leak's TLD
+    use_tld_fallback: bool
+    # Output paths
+    results_file: str
+    cache_path: str
+    backup_prefix: str
+    map_file: str
+    # Wording used in prints, statistics and the map
+    name: str
+    map_title: str
+    noun: str
+    count_label: str
+    event: str
+    # How a leak is shown in progress lines
+    label: str = '{domain}'
+    # Country from the leak itself without asking the LLM, or None; unset sends every leak to the LLM
+    rules: Callable = None
+    # Map an 'unknown' answer to a country read from the leak's location text
+    location_fallback: Callable = None
+
+# --- Rule-based pre-classification (skips the LLM for unambiguous leaks) ---
+# ccTLDs widely registered as generic/vanity domains, left to the LLM
+VANITY_TLDS = {'co', 'io', 'ai', 'tv', 'me', 'cc', 'ws', 'fm', 'ly', 'to', 'gg', 'sh', 'ac', 'la', 'nu', 'tk', 'am', 'im', 'eu'}
+# Country names that are also common words, people or US states
+AMBIGUOUS_COUNTRY_NAMES = {'Georgia', 'Jordan', 'Turkey', 'China', 'Mexico', 'Chad', 'Guinea'}
+COUNTRY_NAMES = sorted((set(TLD_TO_COUNTRY.values()) | set(COUNTRY_COORDINATES)) - AMBIGUOUS_COUNTRY_NAMES, key=len, reverse=True)
+_COUNTRY_ALTERNATION = '|'.join(map(re.escape, COUNTRY_NAMES))
+# Only address-shaped mentions count: a country closing an address line (", Singapore") or
+# "headquartered in / based in <country>". A country named anywhere else in the text is a
+# customer, a branch, a township or text bleeding in from the neighbouring entry
+ADDRESS_COUNTRY_RE = re.compile(
+    r',[ \t]*(' + _COUNTRY_ALTERNATION + r')[ \t]*\.?[ \t]*$'
+    r'|\b(?:headquartered|based) in (?:the )?(' + _COUNTRY_ALTERNATION + r')\b',
+    re.MULTILINE
+)
+LEGAL_FORMS = [
+    (re.compile(r'\bSp\. ?z ?o\.o\.'), 'Poland'),
+    (re.compile(r'\bOyj?\b'), 'Finland'),
+    (re.compile(r'\bS\.p\.A\.'), 'Italy'),
+    (re.compile(r'\bB\.V\.'), 'Netherlands'),
+    (re.compile(r'\bPty\.? Ltd\b'), 'Australia'),
+    (re.compile(r'株式会社'), 'Japan'),
+]
+
+class CountryIdentification(BaseModel):
+    country: str
+
+class CountryBatch(BaseModel):
+    countries: list[str]
+
+# Structured-output schemas sent with every request, generated once
+COUNTRY_SCHEMA = CountryIdentification.model_json_schema()
+COUNTRY_BATCH_SCHEMA = CountryBatch.model_json_schema()
+
+def check_ollama_connection():
+    """Check if Ollama is running and accessible"""
+    url = f"{VLLM_URL}/models" if LLM_BACKEND == 'vllm' else 'http://localhost:11434/api/tags'
+    try:
+        response = requests.get(url, timeout=5)
+        if response.status_code == 200:
+            print("✓ Ollama is running and accessible")
+            return True
+        else:
+            print(f"✗ Ollama returned status code: {response.status_code}")
+            return False
+    except requests.exceptions.ConnectionError:
+        print("✗ Cannot connect to Ollama - is it running?")
+        print("  Please start Ollama with: ollama serve")
+        return False
+    except Exception as e:
+        print(f"✗ Error checking Ollama: {e}")
+        return False
+
+# One keep-alive connection per parallel slot, reused for the whole run
+HTTP_LIMITS = httpx.Limits(max_connections=OLLAMA_NUM_PARALLEL, max_keepalive_connections=OLLAMA_NUM_PARALLEL)
+
+class OpenAICompatClient:
+    """Stand-in for ollama.AsyncClient that talks to an OpenAI-compatible /v1 server"""
+    def __init__(self, base_url=VLLM_URL):
+        self._http = httpx.AsyncClient(base_url=base_url, timeout=None, limits=HTTP_LIMITS)
+    
+    async def close(self):
+        await self._http.aclose()
+    
+    async def chat(self, model, messages, format=None, options=None):
+        # options only carries Ollama runtime settings; vLLM fixes them at server start
+        body = {'model': model, 'messages': messages}
+        if format:
+            # Structured output, enforced server-side like Ollama's format=
+            body['response_format'] = {'type': 'json_schema', 'json_schema': {'name': 'answer', 'schema': format}}
+        response = await self._http.post('/chat/completions', json=body)
+        response.raise_for_status()
+        content = response.json()['choices'][0]['message']['content']
+        return SimpleNamespace(message=SimpleNamespace(content=content))
+
+def make_llm_client():
+    return OpenAICompatClient() if LLM_BACKEND == 'vllm' else AsyncClient(limits=HTTP_LIMITS)
+
+async def query_ollama_for_country(client, source, domain, prompt):
+    """Send the rendered leak prompt to Ollama to identify the country"""
+    try:
+        response = await client.chat(
+            messages=[
+                {'role': 'system', 'content': source.system_prompt},
+                {'role': 'user', 'content': prompt}
+            ],
+            model=OLLAMA_MODEL,
+            format=COUNTRY_SCHEMA,
+            options={'num_ctx': OLLAMA_NUM_CTX},
+        )
+        
+        # The server enforces COUNTRY_SCHEMA, so a plain JSON parse is enough; a missing
+        # or non-string country raises and is handled like any other failed query
+        content = response.message.content
+        answer = orjson.loads(content) if orjson else json.loads(content)
+        return answer['country'].strip()
+    
+    except Exception as e:
+        print(f"    - Ollama query error for {domain}: {e}")
+        return None
+
+async def query_ollama_for_countries(client, source, items):
+    """Identify the countries of several (leak, prompt, key) items in one request; None for failed ones"""
+    if len(items) == 1:
+        leak, prompt, _ = items[0]
+        return [await query_ollama_for_country(client, source, leak['domain'], prompt)]
+    
+    numbered = '\n\n'.join(f"{n}. {prompt}" for n, (_, prompt, _) in enumerate(items, 1))
+    try:
+        response = await client.chat(
+            messages=[
+                {'role': 'system', 'content': source.system_prompt},
+                {'role': 'user', 'content': f"{numbered}\n\nReturn one country per numbered item, in order."}
+            ],
+            model=OLLAMA_MODEL,
+            format=COUNTRY_BATCH_SCHEMA,
+            options={'num_ctx': OLLAMA_NUM_CTX},
+        )
+        content = response.message.content
+        answer = orjson.loads(content) if orjson else json.loads(content)
+        countries = [country.strip() for country in answer['countries']]
+    except Exception as e:
+        print(f"    - Ollama query error for {len(items)} packed leaks: {e}")
+        return [None] * len(items)
+    
+    # A list of the wrong length can't be lined up with the items, so the whole pack is retried next run
+    if len(countries) != len(items):
+        print(f"    - Ollama returned {len(countries)} countries for {len(items)} packed leaks")
+        return [None] * len(items)
+    return countries
+
+def context_key(source, prompt):
+    """Hash the model name, instructions and rendered prompt into a cache key"""
+    return hashlib.sha1('\0'.join((OLLAMA_MODEL, source.system_prompt, prompt)).encode('utf-8')).hexdigest()
+
+def dedupe_key(source, leak):
+    """Leaks with the same key are treated as one entity and identified once"""
+    return tuple(leak[field].strip().casefold() for field in source.dedupe_fields)
+
+def load_ollama_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        print(f"Loaded {len(cache)} cached Ollama answers")
+        return cache
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Ollama cache load failed: {e}")
+        return {}
+
+def save_ollama_cache(cache, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+
+def iter_entries(file_path, entry_start_re):
+    """Stream the raw file and yield the stripped lines of one entry at a time"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = []
+        for line in f:
+            if buffer and entry_start_re.match(line):
+                yield ''.join(buffer).strip().split('\n')
+                buffer = []
+            buffer.append(line)
+        if buffer:
+            yield ''.join(buffer).strip().split('\n')
+
+def rule_based_country(leak):
+    """Country from a ccTLD, a legal-form suffix or a single address-shaped country in the text; None if ambiguous"""
+    tld = leak['tld']
+    if len(tld) == 2 and tld not in VANITY_TLDS and tld in TLD_TO_COUNTRY:
+        return TLD_TO_COUNTRY[tld]
+    
+    text = f"{leak.get('company_name', '')} {leak['description']}"
+    for pattern, country in LEGAL_FORMS:
+        if pattern.search(text):
+            return country
+    
+    named = {trailing or located for trailing, located in ADDRESS_COUNTRY_RE.findall(text)}
+    if len(named) == 1:
+        return named.pop()
+    return None
+
+def load_processed_domains(path):
+    """Domains already in the results file, reading just that column"""
+    if os.path.exists(path) and os.path.getsize(path) == 0:
+        return set()
+    if pacsv:
+        table = pacsv.read_csv(
+            path,
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(include_columns=['domain'], column_types={'domain': pa.string()}),
+        )
+        return set(table.column('domain').to_pylist())
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return set()
+        domain_col = header.index('domain')
+        return {row[domain_col] for row in reader if row}
+
+def result_fields(source):
+    """Column order of the results CSV"""
+    return list(source.fields) + ['ollama_country', 'final_country', 'processed_at']
+
+def results_header(path):
+    """Column names of an existing results CSV, or None if there is no file or it is empty"""
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), None)
+    except FileNotFoundError:
+        return None
+
+def rotate_mismatched_results(source):
+    """Move a results file written with other columns (e.g. another source's) aside so this run starts a new one"""
+    header = results_header(source.results_file)
+    if header is None or header == result_fields(source):
+        return
+    root, ext = os.path.splitext(source.results_file)
+    moved = f"{root}_other_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+    os.replace(source.results_file, moved)
+    print(f"⚠️ {source.results_file} has other columns ({len(header)} instead of {len(result_fields(source))}), moved it to {moved}")
+
+def append_results(source, rows):
+    """Append rows to the results CSV, writing the header only when the file is new"""
+    path = source.results_file
+    header = results_header(path)
+    # Rows under a different header would leave a file that can't be read back
+    if header is not None and header != result_fields(source):
+        raise ValueError(f"{path} has columns {header}, expected {result_fields(source)}")
+    write_header = header is None
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=result_fields(source), lineterminator=os.linesep)
+        if write_header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+def save_checkpoint(source, rows, cache, total):
+    """Append finished rows to the results CSV and persist the Ollama cache"""
+    # One timestamp per checkpoint instead of one datetime per row
+    processed_at = datetime.now().isoformat()
+    for row in rows:
+        row['processed_at'] = processed_at
+    append_results(source, rows)
+    print(f"  ✓ Saved {total} new results to {source.results_file}")
+    save_ollama_cache(cache, source.cache_path)
+
+def process_leaks_with_ollama(source, leaks, batch_size=OLLAMA_NUM_PARALLEL, save_interval=10):
+    """Process leaks using Ollama to identify countries"""
+    return asyncio.run(process_leaks_async(source, leaks, batch_size, save_interval))
+
+async def process_leaks_async(source, leaks, batch_size, save_interval):
+    """Own one LLM client for the whole run so every request reuses its pooled connections"""
+    client = make_llm_client()
+    try:
+        return await stream_leaks(client, source, leaks, batch_size, save_interval)
+    finally:
+        await client.close()
+
+async def stream_leaks(client, source, leaks, batch_size, save_interval):
+    """Stream leaks through Ollama, starting a new request as soon as one of the OLLAMA_NUM_PARALLEL slots frees up"""
+    # Only this run's rows are kept; earlier ones are already in the results file
+    results = []
+    processed_domains = set()
+    processed_count = 0
+    
+    # Load the domains of existing results if available
+    rotate_mismatched_results(source)
+    try:
+        processed_domains = load_processed_domains(source.results_file)
+        print(f"Loaded {len(processed_domains)} processed domains from {source.results_file}")
+    except FileNotFoundError:
+        print("No existing results file found, starting fresh")
+    
+    # Skip if already processed. The pending leaks are collected into a list on purpose: the
+    # shortest-first dispatch order and the per-entity grouping below need all of them up front
+    pending = [leak for leak in leaks if leak['domain'] not in processed_domains]
+    print(f"Processing {len(pending)} {source.noun} with Ollama ({OLLAMA_NUM_PARALLEL} concurrent requests)")
+    
+    cache = load_ollama_cache(source.cache_path)
+    sem = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+    
+    async def ask(items):
+        async with sem:
+            countries = await query_ollama_for_countries(client, source, items)
+        # Only successful answers are cached, failed queries are retried next run
+        for (_, _, key), country in zip(items, countries):
+            if country is not None:
+                cache[key] = country
+        return countries
+    
+    # Shortest descriptions go first so the requests the server batches together have
+    # similar prompt lengths
+    dispatch_order = sorted(range(len(pending)), key=lambda i: len(pending[i]['description']))
+    
+    # Leaks answered by the rules or the cache are done right away. The rest are grouped by
+    # entity, so leaks of the same entity (e.g. re-posted entries) share one answer
+    answered = []
+    entities = {}
+    waiting = []
+    for index in dispatch_order:
+        leak = pending[index]
+        country = source.rules(leak) if source.rules else None
+        if country:
+            answered.append((index, leak, country, 'Rules'))
+            continue
+        prompt = source.prompt_template.format(**leak)
+        key = context_key(source, prompt)
+        if key in cache:
+            answered.append((index, leak, cache[key], 'Ollama'))
+            continue
+        dedupe = dedupe_key(source, leak)
+        entities.setdefault(dedupe, (leak, prompt, key))
+        waiting.append((index, leak, dedupe))
+    
+    # One request per OLLAMA_ROWS_PER_PROMPT entities. The semaphore keeps exactly
+    # OLLAMA_NUM_PARALLEL requests in flight, so there is no idle gap waiting for the
+    # slowest request of a batch
+    asked = {}
+    items = list(entities.items())
+    for start in range(0, len(items), OLLAMA_ROWS_PER_PROMPT):
+        pack = items[start:start + OLLAMA_ROWS_PER_PROMPT]
+        request = asyncio.create_task(ask([item for _, item in pack]))
+        for position, (dedupe, _) in enumerate(pack):
+            asked[dedupe] = (request, position)
+    
+    async def identify(index, leak, dedupe):
+        request, position = asked[dedupe]
+        country = (await request)[position]
+        return index, leak, country or "unknown", 'Ollama'
+    
+    async def known(entry):
+        # Already answered, handed to the loop below like the LLM answers
+        return entry
+    
+    tasks = [asyncio.create_task(known(entry)) for entry in answered]
+    tasks += [asyncio.create_task(identify(*entry)) for entry in waiting]
+    unsaved = []
+    save_task = None
+    for next_done in asyncio.as_completed(tasks):
+        index, leak_item, identified_country, source_name = await next_done
+        label = source.label.format(**leak_item)
+        
+        if identified_country.lower() != 'unknown':
+            print(f"  - {label} → {source_name} identified: {identified_country}")
+            final_country = identified_country
+        elif source.location_fallback:
+            final_country = source.location_fallback(leak_item['location'])
+            print(f"  - {label} → Ollama: unknown, Location fallback: {final_country}")
+        elif source.use_tld_fallback:
+            # Fallback to TLD mapping if Ollama returns unknown
+            tld = leak_item['tld']
+            final_country = TLD_TO_COUNTRY.get(tld, f'Unknown ({tld})')
+            print(f"  - {label} → Ollama: unknown, TLD fallback: {final_country}")
+        else:
+            # No TLD fallback for sources whose domains are generated
+            print(f"  - {label} → Ollama: unknown, no fallback available")
+            final_country = "Unknown"
+        
+        # Add to results
+        result = {field: leak_item[field] for field in source.fields}
+        result['ollama_country'] = identified_country
+        result['final_country'] = final_country
+        results.append((index, result))
+        unsaved.append(result)
+        processed_count += 1
+        
+        # Append results every save_interval batches worth of completions
+        if processed_count % (batch_size * save_interval) == 0 or processed_count == len(pending):
+            # Only the rows finished since the last save are written. The write runs in a
+            # worker thread so responses keep being handled; the previous one finishes first
+            # to keep rows in order
+            if save_task:
+                await save_task
+            save_task = asyncio.create_task(asyncio.to_thread(save_checkpoint, source, unsaved, dict(cache), len(results)))
+            unsaved = []
+    
+    if save_task:
+        await save_task
+    
+    if pending:
+        # One timestamped backup of the finished file per run
+        backup_file = f"{source.backup_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        shutil.copyfile(source.results_file, backup_file)
+        print(f"  ✓ Created backup: {backup_file}")
+    
+    # Hand the rows back in input order, not dispatch or completion order
+    results.sort(key=lambda r: r[0])
+    return [result for _, result in results]
+
+def count_leaks_by_country_from_results(results):
+    """Count leaks by country from processed results"""
+    return Counter(result['final_country'] for result in results)
+
+# Upper edges (fraction of max_count) of gray / green / yellow / orange; anything above is red
+COLOR_BINS = np.array([0, 0.1, 0.3, 0.6])
+COLOR_NAMES = np.array(['gray', 'green', 'yellow', 'orange', 'red'])
+
+def get_colors_for_counts(counts, max_count):
+    """Return a color per count based on leak count intensity"""
+    return COLOR_NAMES[np.digitize(counts, COLOR_BINS * max_count, right=True)]
+
+def create_leak_map(source, country_counts, output_file=None):
+    """Create an interactive folium map showing leak counts by country"""
+    output_file = output_file or source.map_file
+    
+    # Create base map
+    m = folium.Map(location=[20, 0], zoom_start=2)
+    
+    max_count = max(country_counts.values()) if country_counts else 1
+    
+    # Add markers for each country with leaks, all in one GeoJSON point layer
+    # (a single folium element instead of one CircleMarker per country)
+    mapped = [(country, count) for country, count in country_counts.items() if country in COUNTRY_COORDINATES]
+    counts = np.array([count for _, count in mapped], dtype=float)
+    colors = get_colors_for_counts(counts, max_count).tolist()
+    radii = np.minimum(5 + (counts / max_count) * 20, 25).tolist()
+    
+    features = []
+    for (country, count), color, radius in zip(mapped, colors, radii):
+        coords = COUNTRY_COORDINATES[country]
+        
+        # Create popup text
+        popup_text = f"""
+        <b>{country}</b><br>
+        {source.count_label}: {count}<br>
+        Severity: {color.title()}
+        """
+        
+        features.append({
+            'type': 'Feature',
+            'id': country,
+            'geometry': {'type': 'Point', 'coordinates': [coords['lng'], coords['lat']]},
+            'properties': {'radius': radius, 'fillColor': color, 'popup': popup_text}
+        })
+    
+    if features:
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            name=f'{source.name} markers',
+            marker=folium.CircleMarker(color='black', fill=True, fill_opacity=0.7, weight=2),
+            # Only the per-country parts; folium keys these by feature id
+            style_function=lambda f: {'radius': f['properties']['radius'], 'fillColor': f['properties']['fillColor']},
+            popup=folium.GeoJsonPopup(fields=['popup'], labels=False, max_width=200)
+        ).add_to(m)
+    
+    # Add legend
+    legend_html = f'''
+    <div style="position: fixed; 
+                top: 10px; right: 10px; width: 150px; height: 120px; 
+                background-color: white; border:2px solid grey; z-index:9999; 
+                font-size:14px; padding: 10px">
+    <p><b>{source.name} Severity</b></p>
+    <p><i class="fa fa-circle" style="color:red"></i> Critical (60%+)</p>
+    <p><i class="fa fa-circle" style="color:orange"></i> High (30-60%)</p>
+    <p><i class="fa fa-circle" style="color:yellow"></i> Medium (10-30%)</p>
+    <p><i class="fa fa-circle" style="color:green"></i> Low (0-10%)</p>
+    </div>
+    '''
+    m.get_root().html.add_child(folium.Element(legend_html))
+    
+    # Add title
+    title_html = f'''
+    <h3 align="center" style="font-size:20px"><b>{source.map_title}</b></h3>
+    '''
+    m.get_root().html.add_child(folium.Element(title_html))
+    
+    # Save map
+    m.save(output_file)
+    print(f"Map saved as {output_file}")
+    return m
+
+def generate_statistics(source, country_counts):
+    """Generate and print statistics"""
+    total_leaks = country_counts.total()
+    total_countries = len(country_counts)
+    
+    print(f"\n=== {source.name.upper()} STATISTICS ===")
+    print(f"Total {source.count_label.lower()}: {total_leaks}")
+    print(f"Countries affected: {total_countries}")
+    print(f"Average {source.event} per country: {total_leaks / total_countries:.1f}")
+    
+    print(f"\n=== TOP 10 MOST AFFECTED COUNTRIES ===")
+    # Partial selection of the top 10 instead of sorting every country; ties keep first-seen order like most_common
+    for i, (country, count) in enumerate(heapq.nlargest(10, country_counts.items(), key=itemgetter(1)), 1):
+        percentage = (count / total_leaks) * 100
+        print(f"{i:2d}. {country:<25} {count:3d} {source.noun} ({percentage:4.1f}%)")
+
+def count_leaks_by_country_choropleth(df):
+    """Count leaks by country for choropleth map with cleaned country names"""
+    from Generators.combined.country_full_merged import clean_country_names
+    
+    return Counter(clean_country_names(df['final_country']).value_counts().to_dict())
+
+def main(source):
+    """Run one source through parsing, Ollama country identification, statistics and maps"""
+    print(f"Starting {source.name} Map Generator with AI Country Identification...")
+    
+    # Check Ollama connection first
+    if not check_ollama_connection():
+        print("Please start Ollama first with: ollama serve")
+        print(f"Then make sure {OLLAMA_MODEL} model is available with: ollama pull {OLLAMA_MODEL}")
+        return
+    
+    # Parse the leak data
+    print(f"Parsing {source.data_file}...")
+    # Generator: the raw file is read one entry at a time and only the pending leaks are kept
+    leaks = source.parser(source.data_file)
+    
+    # Process domains with Ollama
+    print(f"Processing {source.noun} with AI country identification...")
+    new_results = process_leaks_with_ollama(source, leaks, batch_size=OLLAMA_NUM_PARALLEL, save_interval=2)
+    print(f"Identified {len(new_results)} new {source.noun}")
+    
+    # Statistics and maps cover every processed leak, so the consolidated file is read once here
+    if not os.path.exists(source.results_file):
+        print("No results to map.")
+        return
+    df = pd.read_csv(source.results_file)
+    results = df.to_dict('records')
+    
+    # Count leaks by country from results
+    print(f"Counting {source.event} by country...")
+    country_counts = count_leaks_by_country_from_results(results)
+    
+    # Generate statistics
+    generate_statistics(source, country_counts)
+    
+    # Create and save the dot map
+    print("\nGenerating interactive dot map...")
+    create_leak_map(source, country_counts)
+    
+    # Ask user if they want to create choropleth map
+    try:
+        create_choropleth = input("\nDo you want to create a choropleth map (colors entire countries)? (y/n): ").lower().startswith('y')
+        if create_choropleth:
+            print("Generating choropleth map...")
+            from Generators.combined.country_full_merged import create_country_choropleth_map
+            country_counts_clean = count_leaks_by_country_choropleth(df)
+            choropleth_file = source.map_file.replace('.html', '_countries.html')
+            create_country_choropleth_map(country_counts_clean, output_file=choropleth_file)
+            print(f"✓ Choropleth map created as '{choropleth_file}'")
+    except KeyboardInterrupt:
+        print("\nSkipping choropleth map generation.")
+    
+    print(f"\nDone! Processed {len(results)} {source.noun}.")
+    print(f"Check '{source.results_file}' for detailed results.")
+    print(f"Open '{source.map_file}' in your browser to view the dot map.")
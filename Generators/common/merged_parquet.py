@@ -0,0 +1,25 @@
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# One codec and one all-string schema for merged_updated.parquet, whichever generator writes it
+PARQUET_COMPRESSION = 'snappy'
+
+def to_arrow_table(df: pd.DataFrame):
+    """Convert a chunk to an all-string Arrow table so every chunk shares one Parquet schema"""
+    schema = pa.schema([(c, pa.string()) for c in df.columns])
+    return pa.Table.from_pandas(df.astype('string'), preserve_index=False).cast(schema)
+
+def open_parquet_writer(path, table):
+    """Open a ParquetWriter for tables from to_arrow_table"""
+    return pq.ParquetWriter(path, table.schema, compression=PARQUET_COMPRESSION)
+
+def write_parquet(df: pd.DataFrame, path):
+    """Write a whole DataFrame as merged_updated.parquet"""
+    table = to_arrow_table(df)
+    with open_parquet_writer(path, table) as writer:
+        writer.write_table(table)
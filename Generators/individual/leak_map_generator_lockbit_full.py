@@ -1,9 +1,39 @@
 import folium
+import branca.colormap
 import requests
 import pandas as pd
 from collections import Counter
+import os
 import json
+import hashlib
+import unicodedata
 import numpy as np
+from functools import lru_cache
+from folium.plugins import VectorGridProtobuf
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from shapely.geometry import shape, mapping
+except ImportError:
+    shape = mapping = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+GEOJSON_PATH = 'geojson.json'
+# Douglas-Peucker tolerance (degrees) for the country outlines; 0 keeps every vertex
+SIMPLIFY_TOLERANCE = 0.05
+
+# Vector tiles for use_vector_tiles=True, built once from export_tile_geojson()'s output with
+# `tippecanoe -o world.mbtiles -l countries countries.geojson` and served by an MBTiles server
+VECTOR_TILES_URL = os.getenv('VECTOR_TILES_URL', 'http://localhost:8000/services/world/tiles/{z}/{x}/{y}.pbf')
+VECTOR_TILES_LAYER = 'countries'
 
 # Country name to ISO code mapping for common countries in leak data
 COUNTRY_TO_ISO = {
@@ -135,10 +165,98 @@ COUNTRY_TO_ISO = {
     'UK': 'GBR',
     'Trinidad': 'TTO',
 }
+# Series form of COUNTRY_TO_ISO, so a whole country column is remapped in one map call
+ISO_SERIES = pd.Series(COUNTRY_TO_ISO)
+
+# Common variations of country names mapped to standard names
+CLEAN_MAP = {
+    'United States of America': 'United States',
+    'USA': 'United States',
+    'US': 'United States',
+    'UK': 'United Kingdom',
+    'Great Britain': 'United Kingdom',
+    'Deutschland': 'Germany',
+    'Italia': 'Italy',
+    'España': 'Spain',
+    'République française': 'France',
+    'Nederland': 'Netherlands',
+    'Schweiz': 'Switzerland',
+    'Österreich': 'Austria',
+    'Sverige': 'Sweden',
+    'Norge': 'Norway',
+    'Danmark': 'Denmark',
+    'Suomi': 'Finland',
+    'Polska': 'Poland',
+    'Česká republika': 'Czech Republic',
+    'Slovensko': 'Slovakia',
+    'Magyarország': 'Hungary',
+    'România': 'Romania',
+    'България': 'Bulgaria',
+    'Ελλάδα': 'Greece',
+    'Россия': 'Russia',
+    'Україна': 'Ukraine',
+    'Türkiye': 'Turkey',
+}
+
+def fold_accents(name):
+    """Drop combining accents so 'Türkiye' and 'Turkiye' compare equal"""
+    return ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+
+# CLEAN_MAP keyed by the accent-folded spelling, so unaccented variants match too
+FOLDED_CLEAN_MAP = {fold_accents(k): v for k, v in CLEAN_MAP.items()}
+
+# Property names that hold the ISO 3166 alpha-3 code in common boundary files
+ISO3_PROPERTIES = ['iso_a3', 'ISO_A3', 'ADM0_A3']
+
+def load_geojson(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        geojson = orjson.loads(data) if orjson else json.loads(data)
+    except Exception as e:
+        print(f"⚠️ GeoJSON load failed: {e}")
+        return create_fallback_geojson()
+    
+    # key_on='feature.id' and the ISO lookups expect the alpha-3 code as feature id;
+    # fill it in once here for files that only carry it as a property ('-99' means none)
+    for feature in geojson.get('features', []):
+        if not feature.get('id'):
+            properties = feature.get('properties') or {}
+            codes = (properties.get(key) for key in ISO3_PROPERTIES)
+            feature['id'] = next((code for code in codes if code and code != '-99'), None)
+    return geojson
+
+def simplify_geojson(geojson, tolerance):
+    """Copy of geojson with every geometry simplified, keeping shared borders valid"""
+    features = []
+    for feature in geojson['features']:
+        try:
+            geometry = mapping(shape(feature['geometry']).simplify(tolerance, preserve_topology=True))
+        except Exception:
+            geometry = feature['geometry']
+        features.append({**feature, 'geometry': geometry})
+    return {**geojson, 'features': features}
+
+@lru_cache(maxsize=1)
+def download_world_geojson(tolerance=SIMPLIFY_TOLERANCE):
+    """Parse geojson.json once per process; callers must not modify the result
 
-def download_world_geojson():
-    with open('geojson.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+    With shapely installed the outlines are simplified once and kept in
+    geojson.simplified.<tolerance>.json until geojson.json changes.
+    """
+    if shape is None or not tolerance or not os.path.exists(GEOJSON_PATH):
+        return load_geojson(GEOJSON_PATH)
+    
+    simplified_path = GEOJSON_PATH.replace('.json', f'.simplified.{tolerance}.json')
+    if os.path.exists(simplified_path) and os.path.getmtime(simplified_path) >= os.path.getmtime(GEOJSON_PATH):
+        return load_geojson(simplified_path)
+    
+    geojson = load_geojson(GEOJSON_PATH)
+    if geojson.get('features'):
+        geojson = simplify_geojson(geojson, tolerance)
+        with open(simplified_path, 'wb') as f:
+            f.write(orjson.dumps(geojson) if orjson else json.dumps(geojson).encode('utf-8'))
+    return geojson
 
 def create_fallback_geojson():
     """Create a minimal GeoJSON for major countries if download fails"""
@@ -148,11 +266,21 @@ def create_fallback_geojson():
         "features": []
     }
 
+# The map only needs the country column
+LEAK_CSV_OPTIONS = {'usecols': ['final_country'], 'dtype': {'final_country': 'string'}}
+
 def load_leak_data(csv_file='leak_results.csv'):
     """Load leak data from CSV file"""
     try:
-        df = pd.read_csv(csv_file)
-        return df
+        if pyarrow is not None:
+            try:
+                # Multi-threaded parser
+                return pd.read_csv(csv_file, engine='pyarrow', **LEAK_CSV_OPTIONS)
+            except pd.errors.ParserError:
+                # pandas re-raises pyarrow's ArrowInvalid as ParserError, e.g. for line breaks
+                # inside quoted descriptions or short rows, which the C engine handles
+                pass
+        return pd.read_csv(csv_file, **LEAK_CSV_OPTIONS)
     except FileNotFoundError:
         print(f"Error: {csv_file} not found. Please run the main leak analyzer first.")
         return pd.DataFrame()
@@ -162,87 +290,57 @@ def count_leaks_by_country(df):
     if df.empty:
         return Counter()
     
-    country_counts = Counter()
-    for _, row in df.iterrows():
-        country = row['final_country']
-        # Clean up country names and handle special cases
-        country = clean_country_name(country)
-        country_counts[country] += 1
-    
-    return country_counts
+    # Clean up country names and handle special cases for the whole column at once
+    countries = clean_country_names(df['final_country'])
+    # sort=False keeps first-appearance order, like counting row by row
+    return Counter(countries.value_counts(sort=False).to_dict())
 
-def clean_country_name(country):
-    """Clean and standardize country names"""
-    if pd.isna(country):
-        return 'Unknown'
-    
-    country = str(country).strip()
-    
+def clean_unique_name(name):
+    """Clean and standardize one distinct country spelling"""
+    name = name.strip()
     # Handle special cases
-    if country.startswith('Unknown ('):
+    if name.startswith('Unknown ('):
         return 'Unknown'
-    
-    # Map common variations to standard names
-    mapping = {
-        'United States of America': 'United States',
-        'USA': 'United States',
-        'US': 'United States',
-        'UK': 'United Kingdom',
-        'Great Britain': 'United Kingdom',
-        'Deutschland': 'Germany',
-        'Italia': 'Italy',
-        'España': 'Spain',
-        'République française': 'France',
-        'Nederland': 'Netherlands',
-        'Schweiz': 'Switzerland',
-        'Österreich': 'Austria',
-        'Sverige': 'Sweden',
-        'Norge': 'Norway',
-        'Danmark': 'Denmark',
-        'Suomi': 'Finland',
-        'Polska': 'Poland',
-        'Česká republika': 'Czech Republic',
-        'Slovensko': 'Slovakia',
-        'Magyarország': 'Hungary',
-        'România': 'Romania',
-        'България': 'Bulgaria',
-        'Ελλάδα': 'Greece',
-        'Россия': 'Russia',
-        'Україна': 'Ukraine',
-        'Türkiye': 'Turkey',
-    }
-    
-    return mapping.get(country, country)
+    return FOLDED_CLEAN_MAP.get(fold_accents(name), name)
 
-def create_country_choropleth_map(country_counts, output_file='leak_map_countries.html'):
-    """Create a choropleth map that colors entire countries based on leak counts"""
-    
-    print("Downloading world country boundaries...")
-    world_geojson = download_world_geojson()
-    
-    if not world_geojson.get('features'):
-        print("No GeoJSON data available. Creating a basic map with markers...")
-        return create_fallback_marker_map(country_counts, output_file)
-    
-    # Prepare data for choropleth
-    country_data = []
+def clean_country_names(s):
+    """Clean and standardize a whole column of country names"""
+    s = s.astype('string')
+    # A column has far fewer distinct spellings than rows, so normalize each one once
+    norm = {name: clean_unique_name(name) for name in s.dropna().unique()}
+    return s.map(norm).fillna('Unknown')
+
+def clean_country_name(country):
+    """Clean and standardize country names"""
+    return clean_country_names(pd.Series([country], dtype=object)).iloc[0]
+
+def create_country_choropleth_map(country_counts, output_file='leak_map_countries.html', include_nan_countries=False, use_vector_tiles=False):
+    """Create a choropleth map that colors entire countries based on leak counts
+
+    Only countries with leaks are embedded unless include_nan_countries is set.
+    With use_vector_tiles the outlines are not embedded at all but streamed from
+    VECTOR_TILES_URL, so the browser only draws the tiles in view.
+    """
+    
+    if not use_vector_tiles:
+        print("Downloading world country boundaries...")
+        world_geojson = download_world_geojson()
+        
+        if not world_geojson.get('features'):
+            print("No GeoJSON data available. Creating a basic map with markers...")
+            return create_fallback_marker_map(country_counts, output_file)
+    
+    # Prepare data for choropleth, one column at a time
     max_count = max(country_counts.values()) if country_counts else 1
-    
-    for country, count in country_counts.items():
-        iso_code = COUNTRY_TO_ISO.get(country, country.upper()[:3])
-        country_data.append({
-            'country': country,
-            'iso_code': iso_code,
-            'leak_count': count,
-            'severity': get_severity_level(count, max_count)
-        })
-    
-    # Create dataframe for choropleth
-    df_map = pd.DataFrame(country_data)
+    df_map = pd.DataFrame({'country': list(country_counts), 'leak_count': list(country_counts.values())})
+    df_map['iso_code'] = df_map['country'].map(ISO_SERIES).fillna(df_map['country'].str.upper().str[:3])
+    # Same buckets as get_severity_level
+    bins = [-1, 0, max_count * 0.1, max_count * 0.3, max_count * 0.6, max_count]
+    df_map['severity'] = pd.cut(df_map['leak_count'], bins=bins, labels=SEVERITY_LABELS)
     
     # Normalize leak counts logarithmically
-    df_map['log_leak_count'] = df_map['leak_count'].apply(lambda x: np.log10(x + 1))
-
+    df_map['log_leak_count'] = np.log10(df_map['leak_count'].to_numpy(dtype=np.float64) + 1.0)
+    
     # Create base map
     m = folium.Map(
         location=[20, 0], 
@@ -251,50 +349,45 @@ def create_country_choropleth_map(country_counts, output_file='leak_map_countrie
     )
     
 
-    folium.Choropleth(
-        geo_data=world_geojson,
-        name='Data Leaks by Country',
-        data=df_map,
-        columns=['iso_code', 'log_leak_count'],  # <-- use log scale
-        key_on='feature.id',
-        fill_color='YlOrRd',
-        fill_opacity=0.7,
-        line_opacity=0.2,
-        legend_name='Number of Data Leaks (log scale)',
-        nan_fill_color='lightgray',
-        nan_fill_opacity=0.3
-    ).add_to(m)
-    
-    # Add tooltips with detailed information
-    for _, row in df_map.iterrows():
-        # Find matching feature in GeoJSON for tooltip placement
+    if use_vector_tiles:
+        add_vector_tile_layer(m, df_map)
+    else:
+        # Countries without leaks would only be drawn in nan_fill_color, yet every one of them
+        # is serialized into the HTML; keep just the ones there is data for. The kept features
+        # are new dicts (the parsed GeoJSON is shared across calls) holding only what the map
+        # reads: the id, the outline and the tooltip values. bbox and other properties are dropped
+        stats_by_iso = dict(zip(df_map['iso_code'], zip(df_map['leak_count'].tolist(), df_map['severity'].astype(str).tolist())))
+        features = []
         for feature in world_geojson['features']:
-            if feature.get('id') == row['iso_code']:
-                # Get country centroid for tooltip placement (simplified)
-                coords = get_country_centroid(feature)
-                if coords:
-                    folium.CircleMarker(
-                        location=coords,
-                        radius=3,
-                        popup=folium.Popup(
-                            f"""
-                            <div style="font-family: Arial; width: 200px;">
-                                <h4 style="margin: 0; color: #333;">{row['country']}</h4>
-                                <hr style="margin: 5px 0;">
-                                <p style="margin: 5px 0;"><b>Leaked Domains:</b> {row['leak_count']}</p>
-                                <p style="margin: 5px 0;"><b>Severity:</b> {row['severity']}</p>
-                                <p style="margin: 5px 0;"><b>ISO Code:</b> {row['iso_code']}</p>
-                            </div>
-                            """,
-                            max_width=220
-                        ),
-                        color='red',
-                        fillColor='red',
-                        fillOpacity=0.8,
-                        weight=1,
-                        tooltip=f"{row['country']}: {row['leak_count']} leaks"
-                    ).add_to(m)
-                break
+            leak_count, severity = stats_by_iso.get(feature.get('id'), (0, 'No Data'))
+            if leak_count or include_nan_countries:
+                features.append({
+                    'type': 'Feature',
+                    'id': feature.get('id'),
+                    'geometry': feature['geometry'],
+                    'properties': {'name': (feature.get('properties') or {}).get('name'), 'leak_count': leak_count, 'severity': severity}
+                })
+        geo_data = {'type': 'FeatureCollection', 'features': features}
+        
+        choropleth = folium.Choropleth(
+            geo_data=geo_data,
+            name='Data Leaks by Country',
+            data=df_map,
+            columns=['iso_code', 'log_leak_count'],  # <-- use log scale
+            key_on='feature.id',
+            fill_color='YlOrRd',
+            fill_opacity=0.7,
+            line_opacity=0.2,
+            legend_name='Number of Data Leaks (log scale)',
+            nan_fill_color='lightgray',
+            nan_fill_opacity=0.3
+        ).add_to(m)
+        
+        # Add tooltips with detailed information, one for the whole country layer
+        folium.GeoJsonTooltip(
+            fields=['name', 'leak_count', 'severity'],
+            aliases=['Country', 'Leaked Domains', 'Severity']
+        ).add_to(choropleth.geojson)
     
     # Add custom legend
     legend_html = create_custom_legend(country_counts, max_count)
@@ -323,28 +416,41 @@ def create_country_choropleth_map(country_counts, output_file='leak_map_countrie
     
     return m
 
-def get_country_centroid(feature):
-    """Get approximate centroid of a country feature for marker placement"""
-    try:
-        # This is a simplified centroid calculation
-        # In production, you'd use proper geometric calculations
-        geometry = feature.get('geometry', {})
-        if geometry.get('type') == 'Polygon':
-            coords = geometry['coordinates'][0]
-            if coords:
-                lats = [coord[1] for coord in coords]
-                lngs = [coord[0] for coord in coords]
-                return [sum(lats)/len(lats), sum(lngs)/len(lngs)]
-        elif geometry.get('type') == 'MultiPolygon':
-            # Use first polygon for simplicity
-            coords = geometry['coordinates'][0][0]
-            if coords:
-                lats = [coord[1] for coord in coords]
-                lngs = [coord[0] for coord in coords]
-                return [sum(lats)/len(lats), sum(lngs)/len(lngs)]
-    except Exception:
-        pass
-    return None
+def add_vector_tile_layer(m, df_map, url=VECTOR_TILES_URL):
+    """Color the countries of a served vector tile set by their log leak count"""
+    log_counts = df_map['log_leak_count']
+    lo, hi = float(log_counts.min()), float(log_counts.max())
+    colormap = branca.colormap.linear.YlOrRd_09.scale(lo, hi if hi > lo else lo + 1)
+    colormap.caption = 'Number of Data Leaks (log scale)'
+    fills = {iso: colormap(value) for iso, value in zip(df_map['iso_code'].tolist(), log_counts.tolist())}
+    
+    # Options are passed as JavaScript so each tile feature can look up its own color
+    options = f"""{{
+        "vectorTileLayerStyles": {{
+            "{VECTOR_TILES_LAYER}": (function (fills) {{
+                return function (properties) {{
+                    var fill = fills[properties.iso_a3];
+                    return {{fill: true, weight: 1, color: 'black', opacity: 0.2,
+                             fillColor: fill || 'lightgray', fillOpacity: fill ? 0.7 : 0.3}};
+                }};
+            }})({json.dumps(fills)})
+        }}
+    }}"""
+    VectorGridProtobuf(url, 'Data Leaks by Country', options).add_to(m)
+    colormap.add_to(m)
+
+def export_tile_geojson(path='countries.geojson'):
+    """Write the boundaries with their ISO code as iso_a3 property, the tippecanoe input for vector tiles"""
+    features = [
+        {'type': 'Feature', 'geometry': f['geometry'], 'properties': {'iso_a3': f.get('id'), 'name': (f.get('properties') or {}).get('name')}}
+        for f in download_world_geojson()['features']
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f, ensure_ascii=False)
+    print(f"Tile source saved as {path}")
+
+# Severity buckets (share of the max count), lowest first
+SEVERITY_LABELS = ['No Data', 'Low', 'Medium', 'High', 'Critical']
 
 def get_severity_level(count, max_count):
     """Determine severity level based on count"""
@@ -359,11 +465,8 @@ def get_severity_level(count, max_count):
     else:
         return 'Critical'
 
-def create_custom_legend(country_counts, max_count):
-    """Create a toggleable custom HTML legend"""
-    total_leaks = sum(country_counts.values())
-    
-    return f'''
+# Static parts of the legend around the totals line, so only that line is formatted per call
+LEGEND_HEAD = '''
     <div id="legendContainer" style="position: fixed; 
                 top: 10px; right: 10px; width: 220px; 
                 background-color: white; border:2px solid grey; z-index:9999; 
@@ -380,8 +483,8 @@ def create_custom_legend(country_counts, max_count):
             <div style="margin: 5px 0;"><i style="background: #FC4E2A; width: 12px; height: 12px; display: inline-block; margin-right: 8px;"></i>Low (0–10%)</div>
             <div style="margin: 5px 0;"><i style="background: lightgray; width: 12px; height: 12px; display: inline-block; margin-right: 8px;"></i>No Data</div>
             <hr style="margin: 8px 0;">
-            <small><b>Total:</b> {total_leaks} leaks<br><b>Countries:</b> {len(country_counts)}</small>
-        </div>
+'''
+LEGEND_TAIL = '''        </div>
     </div>
     <button id="showLegendButton" onclick="toggleLegend()" 
             style="display:none; position: fixed; top: 10px; right: 10px; 
@@ -390,20 +493,27 @@ def create_custom_legend(country_counts, max_count):
         Show Legend
     </button>
     <script>
-    function toggleLegend() {{
+    function toggleLegend() {
         var legend = document.getElementById('legendContainer');
         var showButton = document.getElementById('showLegendButton');
-        if (legend.style.display === 'none') {{
+        if (legend.style.display === 'none') {
             legend.style.display = 'block';
             showButton.style.display = 'none';
-        }} else {{
+        } else {
             legend.style.display = 'none';
             showButton.style.display = 'block';
-        }}
-    }}
+        }
+    }
     </script>
     '''
 
+@lru_cache(maxsize=None)
+def legend_html(total_leaks, total_countries):
+    return LEGEND_HEAD + f'            <small><b>Total:</b> {total_leaks} leaks<br><b>Countries:</b> {total_countries}</small>\n' + LEGEND_TAIL
+
+def create_custom_legend(country_counts, max_count):
+    """Create a toggleable custom HTML legend"""
+    return legend_html(sum(country_counts.values()), len(country_counts))
 
 def create_fallback_marker_map(country_counts, output_file):
     """Create a fallback map with markers if GeoJSON fails"""
@@ -455,13 +565,34 @@ def print_map_statistics(country_counts, mapped_countries):
         percentage = (count / total_leaks) * 100
         print(f"{i:2d}. {country:<25} {count:3d} leaks ({percentage:4.1f}%)")
 
-def main():
+def inputs_digest(*paths, settings=()):
+    """blake2b over the bytes of the given files and the settings; missing files are skipped"""
+    digest = hashlib.blake2b()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    digest.update(repr(settings).encode('utf-8'))
+    return digest.hexdigest()
+
+def main(csv_file='leak_results.csv', output_file='leak_map_countries.html'):
     """Main function to create the choropleth map"""
     print("Creating Data Leak Choropleth Map...")
     
+    # Skip the rebuild when the map was generated from identical inputs. This script's own
+    # bytes stand in for a version number, and the env-driven settings are hashed too
+    digest_file = output_file + '.sha'
+    digest = inputs_digest(csv_file, GEOJSON_PATH, os.path.abspath(__file__),
+                           settings=(SIMPLIFY_TOLERANCE, VECTOR_TILES_URL, VECTOR_TILES_LAYER))
+    if os.path.exists(output_file) and os.path.exists(digest_file):
+        with open(digest_file, 'r', encoding='utf-8') as f:
+            if f.read().strip() == digest:
+                print(f"✓ {output_file} is up to date with {csv_file}, nothing to rebuild")
+                return
+    
     # Load leak data
     print("Loading leak data...")
-    df = load_leak_data()
+    df = load_leak_data(csv_file)
     
     if df.empty:
         print("No data found. Please run the main leak analyzer first.")
@@ -475,9 +606,11 @@ def main():
         return
     
     # Create choropleth map
-    create_country_choropleth_map(country_counts)
+    create_country_choropleth_map(country_counts, output_file)
+    with open(digest_file, 'w', encoding='utf-8') as f:
+        f.write(digest)
     
-    print("\nDone! Open 'leak_map_countries.html' in your browser to view the choropleth map.")
+    print(f"\nDone! Open '{output_file}' in your browser to view the choropleth map.")
 
 if __name__ == "__main__":
     main()
@@ -4,28 +4,38 @@ from datetime import datetime
 from urllib.parse import urlparse
 from Utils.country_mapping import TLD_TO_COUNTRY
 
-def extract_domain_info(url):
-    """Extract domain and TLD from URL"""
+def split_domain_info(url):
+    """Extract domain and TLD from URL by plain splitting, for lines urlparse can't handle"""
     # Remove protocol if present
     if '://' in url:
         url = url.split('://', 1)[1]
-    
     # Remove path if present
     if '/' in url:
         url = url.split('/', 1)[0]
-    
-    # Extract TLD
     parts = url.split('.')
     if len(parts) >= 2:
-        domain = url
-        tld = parts[-1]
-        return domain, tld
-    else:
-        return url, ''
+        return url, parts[-1]
+    return url, ''
 
-def get_country_from_tld(tld):
-    """Get country from TLD using the mapping"""
-    return TLD_TO_COUNTRY.get(tld.lower(), 'Unknown')
+def extract_domain_info(url):
+    """Extract domain and TLD from URL"""
+    # urlparse raises on brackets ('ex[1].com') or cuts the host at them ('http://[::1]/'), so one
+    # malformed line would abort the run; those lines keep the plain split
+    if '[' in url or ']' in url:
+        return split_domain_info(url)
+    
+    # urlparse only finds the host after '//', so add it when there is no scheme
+    netloc_url = url if '://' in url else '//' + url
+    
+    # Host without user info or port
+    try:
+        domain = urlparse(netloc_url).netloc.rpartition('@')[2].partition(':')[0]
+    except ValueError:
+        return split_domain_info(url)
+    
+    # Extract TLD
+    _, dot, tld = domain.rpartition('.')
+    return domain, tld if dot else ''
 
 def process_clop_file():
     """Process clop.txt and generate results.csv"""
@@ -36,35 +46,25 @@ def process_clop_file():
         print(f"Error: {input_file} not found")
         return
     
-    results = []
     current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
     # Read URLs from clop.txt
     with open(input_file, 'r', encoding='utf-8') as f:
         urls = [line.strip() for line in f if line.strip()]
     
-    # Process each URL
+    # Process each URL into a row tuple in fieldnames order; the country comes straight from the TLD mapping
+    results = []
     for url in urls:
         domain, tld = extract_domain_info(url)
-        country = get_country_from_tld(tld)
-        
-        result = {
-            'domain': domain,
-            'tld': tld,
-            'status': 'published',
-            'description': '-',
-            'ollama_country': country,
-            'final_country': country,
-            'processed_at': current_time
-        }
-        results.append(result)
+        country = TLD_TO_COUNTRY.get(tld.lower(), 'Unknown')
+        results.append((domain, tld, 'published', '-', country, country, current_time))
     
     # Write results to CSV
     fieldnames = ['domain', 'tld', 'status', 'description', 'ollama_country', 'final_country', 'processed_at']
     
     with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
         writer.writerows(results)
     
     print(f"Processed {len(results)} URLs and saved to {output_file}")
@@ -1,13 +1,21 @@
 import os
+import csv
 import pandas as pd
 import glob
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pacsv = pq = None
+
 def merge_csv_files():
     # Set fixed directory path
     csv_dir = r"\leakmap\Csv"
     
-    # Get all CSV files in the specified directory
-    csv_files = glob.glob(os.path.join(csv_dir, "*.csv"))
+    # Get all CSV files in the specified directory, except the merged.csv output of a previous run
+    csv_files = [f for f in glob.glob(os.path.join(csv_dir, "*.csv")) if os.path.basename(f).lower() != "merged.csv"]
     
     if not csv_files:
         print(f"No CSV files found in {csv_dir}.")
@@ -15,6 +23,11 @@ def merge_csv_files():
     
     print(f"Found {len(csv_files)} CSV file(s): {[os.path.basename(f) for f in csv_files]}")
     
+    # Read with pyarrow when installed: no pandas object columns, and a Parquet copy comes for free
+    if pa:
+        merge_with_pyarrow(csv_files, csv_dir)
+        return
+    
     # List to store all dataframes
     dataframes = []
     
@@ -39,5 +52,58 @@ def merge_csv_files():
     merged_df.to_csv(output_path, index=False)
     print(f"Successfully merged {len(dataframes)} files into {output_path} with {len(merged_df)} total rows")
 
+def csv_header(file):
+    """Column names from the first line of a CSV file"""
+    # utf-8-sig drops a BOM (CSVs saved by Excel) the same way pyarrow's reader does
+    with open(file, 'r', newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), [])
+
+def read_csv_as_strings(file, columns):
+    """Read a CSV into an Arrow table with every column as string, so files whose columns infer to different types still concatenate"""
+    convert_options = pacsv.ConvertOptions(column_types={column: pa.string() for column in columns}, strings_can_be_null=True)
+    return pacsv.read_csv(file, parse_options=pacsv.ParseOptions(newlines_in_values=True), convert_options=convert_options)
+
+def conform(table, schema):
+    """Put a table's columns in the merged order, filling the ones it lacks with nulls"""
+    return pa.Table.from_arrays(
+        [table.column(name) if name in table.column_names else pa.chunked_array([pa.nulls(table.num_rows, pa.string())]) for name in schema.names],
+        schema=schema,
+    )
+
+def merge_with_pyarrow(csv_files, csv_dir):
+    """Append the CSV files one at a time to merged.csv and merged.parquet, so only one file is held in memory"""
+    headers = {}
+    for file in csv_files:
+        try:
+            headers[file] = csv_header(file)
+        except Exception as e:
+            print(f"Error reading {file}: {e}")
+    
+    if not headers:
+        print("No valid CSV files to merge.")
+        return
+    
+    # Union of all columns in first-seen order, like pd.concat; the writers need it up front
+    columns = list(dict.fromkeys(column for header in headers.values() for column in header))
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    
+    output_path = os.path.join(csv_dir, "merged.csv")
+    # Smaller and much faster to read back than the CSV
+    parquet_path = os.path.join(csv_dir, "merged.parquet")
+    merged_files = merged_rows = 0
+    with pacsv.CSVWriter(output_path, schema) as csv_writer, pq.ParquetWriter(parquet_path, schema, compression='zstd') as parquet_writer:
+        for file, header in headers.items():
+            try:
+                table = conform(read_csv_as_strings(file, header), schema)
+            except Exception as e:
+                print(f"Error reading {file}: {e}")
+                continue
+            print(f"Loaded {file} with {table.num_rows} rows")
+            csv_writer.write_table(table)
+            parquet_writer.write_table(table)
+            merged_files += 1
+            merged_rows += table.num_rows
+    print(f"Successfully merged {merged_files} files into {output_path} and {parquet_path} with {merged_rows} total rows")
+
 if __name__ == "__main__":
     merge_csv_files()